@@ -1,7 +1,13 @@
 #!python3
 from binascii import hexlify
 
-from decoda import ConnectionManager, Decoda, parts_from_can_id, spec_provider
+from decoda import (
+    Address,
+    ConnectionManager,
+    Decoda,
+    parts_from_can_id,
+    spec_provider,
+)
 
 
 def demo_parts_functions():
@@ -104,8 +110,10 @@ def demo_live_decoding(spec):
         print("*" * 30)
 
     def print_defragged(msg):
-        src = f"{msg.src_address}: {spec.preferred_address_name(msg.src_address)}"
-        dst = f"{msg.dst_address}: {spec.preferred_address_name(msg.dst_address)}"
+        src_name = spec.preferred_address_name(msg.src_address.num)
+        dst_name = spec.preferred_address_name(msg.dst_address.num)
+        src = f"{msg.src_address.num}: {src_name}"
+        dst = f"{msg.dst_address.num}: {dst_name}"
         print(f"RECV: {msg.pgn.id} - {msg.pgn.name} - {src} => {dst}")
         for decoded in msg.decoded:
             print(f" - {decoded}")
@@ -114,10 +122,33 @@ def demo_live_decoding(spec):
 
     cm = ConnectionManager(decoda, handle_defrag_error)
 
+    payload = bytes(
+        [0x12, 0x34]  # Lamps
+        + [0x10, 0x00, 0x01, 0x05]  # SPN 16 - FMI 1 - Count 5
+        + [0x2E, 0x00, 0x01, 0x09]  # SPN 46 - FMI 1 - Count 9
+        + [0x2E, 0x00, 0x02, 0x09]  # SPN 46 - FMI 2 - Count 9
+        + [0xB5, 0x0D, 0x03, 0x01]  # SPN 3509 - FMI 1 - Count 1
+    )
+
+    # The sender opens the session with a request to send, which gives the
+    # size of the message
+    request_to_send_pgn_65526 = bytes(
+        [
+            16,  # Request to send
+            len(payload),  # LSB size
+            0x00,  # MSB size
+            3,  # Num packets
+            0xFF,  # Max packets per CTS
+            0xCA,  # LSB PGN
+            0xFE,  # PGN
+            0x00,  # MSB PGN
+        ]
+    )
+    # ...and the receiver replies with a clear to send
     clear_to_send_pgn_65526 = bytes(
         [
             17,  # Clear to send
-            3,  # Num packes
+            3,  # Num packets
             1,  # Next packet seq no
             0xFF,  # RFU
             0xFF,  # RFU
@@ -127,36 +158,31 @@ def demo_live_decoding(spec):
         ]
     )
 
-    decoda.handle_message(1, 1, 1, 60416, clear_to_send_pgn_65526)
+    one, two = Address(1), Address(2)
+    decoda.handle_message(1, one, two, 60416, request_to_send_pgn_65526)
+    decoda.handle_message(1, two, one, 60416, clear_to_send_pgn_65526)
 
-    payload = bytes(
-        [0x12, 0x34]  # Lamps
-        + [0x10, 0x00, 0x01, 0x05]  # SPN 16 - FMI 1 - Count 5
-        + [0x2E, 0x00, 0x01, 0x09]  # SPN 46 - FMI 1 - Count 9
-        + [0x2E, 0x00, 0x02, 0x09]  # SPN 46 - FMI 2 - Count 9
-        + [0xB5, 0x0D, 0x03, 0x01]  # SPN 3509 - FMI 1 - Count 1
-    )
-    decoda.handle_message(1, 1, 1, 60160, bytes([1]) + payload[:7])
-    decoda.handle_message(1, 1, 1, 60160, bytes([2]) + payload[7:14])
+    decoda.handle_message(1, one, two, 60160, bytes([1]) + payload[:7])
+    decoda.handle_message(1, one, two, 60160, bytes([2]) + payload[7:14])
     # Double up will be ignored and show up as error
-    decoda.handle_message(1, 1, 1, 60160, bytes([2]) + payload[7:14])
-    decoda.handle_message(1, 1, 1, 60160, bytes([3]) + payload[14:])
+    decoda.handle_message(1, one, two, 60160, bytes([2]) + payload[7:14])
+    decoda.handle_message(1, one, two, 60160, bytes([3]) + payload[14:])
     # Double up will be ignored and show up as error
-    decoda.handle_message(1, 1, 1, 60160, bytes([3]) + payload[14:])
+    decoda.handle_message(1, one, two, 60160, bytes([3]) + payload[14:])
 
     # Demo that it works with multiple active transfers
-    decoda.handle_message(1, 2, 1, 60416, clear_to_send_pgn_65526)
-    decoda.handle_message(1, 1, 2, 60416, clear_to_send_pgn_65526)
+    decoda.handle_message(1, two, one, 60416, request_to_send_pgn_65526)
+    decoda.handle_message(1, one, two, 60416, request_to_send_pgn_65526)
 
-    decoda.handle_message(1, 2, 1, 60160, bytes([1]) + payload[:7])
-    decoda.handle_message(1, 1, 2, 60160, bytes([1]) + payload[:7])
-    decoda.handle_message(1, 1, 2, 60160, bytes([2]) + payload[7:14])
-    decoda.handle_message(1, 2, 1, 60160, bytes([2]) + payload[7:14])
+    decoda.handle_message(1, two, one, 60160, bytes([1]) + payload[:7])
+    decoda.handle_message(1, one, two, 60160, bytes([1]) + payload[:7])
+    decoda.handle_message(1, one, two, 60160, bytes([2]) + payload[7:14])
+    decoda.handle_message(1, two, one, 60160, bytes([2]) + payload[7:14])
     print(
         f"ConnectionManager should have 2 active items atm: {len(cm._active_defrags)}"
     )
-    decoda.handle_message(1, 2, 1, 60160, bytes([3]) + payload[14:])
-    decoda.handle_message(1, 1, 2, 60160, bytes([3]) + payload[14:])
+    decoda.handle_message(1, two, one, 60160, bytes([3]) + payload[14:])
+    decoda.handle_message(1, one, two, 60160, bytes([3]) + payload[14:])
 
 
 def run():
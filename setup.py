@@ -33,6 +33,8 @@ INSTALL_REQUIRES = [
     "attrs",
 ]
 EXTRAS_REQUIRE = {
+    "batch": ["numpy"],
+    "export": ["numpy", "pyarrow"],
     "sae_spec_converter": [
         # Installing pretty_j1939 instead of its dependencies, even
         # though we don't really use it directly (i.e. is it here just so
@@ -109,6 +111,7 @@ if __name__ == "__main__":
                 "enrich_spec=decoda.sae_spec_converter.enrich_spec:main [sae_spec_converter]",
                 "correct_spec=decoda.sae_spec_converter.correct_spec:main [sae_spec_converter]",
                 "remove_bad_items=decoda.sae_spec_converter.remove_bad_items:main [sae_spec_converter]",
+                "decoda=decoda.cli:main",
             ]
         },
     )
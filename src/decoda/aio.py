@@ -0,0 +1,74 @@
+# Copyright Andrew Dodd
+import asyncio
+
+import attr
+
+from decoda.transport import ConnectionManager, Decoda, Message
+
+# Put on the queue once the frames run out
+_END = object()
+
+
+class AsyncDecoda:
+    """
+    Decodes an async iterator of (timestamp, can_id, payload) frames into an
+    async iterator of Messages, with ConnectionManager reassembly.
+
+    The decoded messages wait in a queue of at most max_queue_size messages,
+    and no more frames are read while it is full, so a slow consumer holds
+    back the frame source rather than the messages piling up. Only one
+    stream should be decoded at a time, as the transport sessions are shared.
+    """
+
+    def __init__(
+        self,
+        spec,
+        error_handler=None,
+        defragmenting_error_callback=None,
+        publish_transport_frames=True,
+        max_queue_size=1024,
+    ):
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be positive")
+
+        self._pending = []
+        self.__spec__ = spec
+        self._decoda = Decoda(spec, self._pending.append, error_handler)
+        self._cm = ConnectionManager(
+            self._decoda,
+            (
+                defragmenting_error_callback
+                if defragmenting_error_callback
+                else lambda *x: print(*x)
+            ),
+            publish_transport_frames,
+        )
+        self._max_queue_size = max_queue_size
+
+    async def decode(self, frames):
+        queue = asyncio.Queue(self._max_queue_size)
+        producer = asyncio.ensure_future(self._produce(frames, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    return
+                if item.__class__ is not Message:
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    async def _produce(self, frames, queue):
+        pending = self._pending
+        try:
+            async for timestamp, can_id, payload in frames:
+                self._cm.handle_frame(can_id, payload, timestamp)
+                for message in pending:
+                    await queue.put(attr.evolve(message, timestamp=timestamp))
+                pending.clear()
+        except Exception as e:
+            # Passed on to be raised by the consumer
+            await queue.put(e)
+            return
+        await queue.put(_END)
@@ -0,0 +1,174 @@
+# Copyright Andrew Dodd
+from enum import IntEnum
+from typing import Dict
+
+import attr
+import numpy as np
+
+from decoda.main import (
+    PGN,
+    SPN,
+    EncodedValue,
+    ScalarValue,
+    is_simple_numeric_record,
+)
+
+
+class BatchStatus(IntEnum):
+    VALID = 0
+    NOT_AVAILABLE = 1
+    ERROR_INDICATOR = 2
+    PARAMETER_SPECIFIC = 3
+    CLIPPED_TO_MIN = 4
+    CLIPPED_TO_MAX = 5
+    NO_ENCODING = 6
+
+
+@attr.s(frozen=True)
+class BatchColumn:
+    spn: SPN = attr.ib()
+    raw: np.ndarray = attr.ib()
+    value: np.ndarray = attr.ib()
+    status: np.ndarray = attr.ib()
+
+
+def as_payload_array(payloads):
+    """
+    Convert an (N, L) uint8 array, or a sequence of equal length bytes, into
+    an (N, L) uint8 array.
+    """
+    if isinstance(payloads, np.ndarray):
+        if payloads.ndim != 2:
+            raise ValueError("payloads must be an (N, L) array")
+        return np.ascontiguousarray(payloads, dtype=np.uint8)
+
+    payloads = list(payloads)
+    if not payloads:
+        return np.zeros((0, 0), dtype=np.uint8)
+    length = len(payloads[0])
+    if any(len(p) != length for p in payloads):
+        raise ValueError("payloads must all be the same length")
+    return np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(
+        len(payloads), length
+    )
+
+
+def _extract_section(payloads, section):
+    # Gather the bytes of the section into little endian 64-bit words
+    n, length = payloads.shape
+    end = min(section.byte_idx + section.byte_span, length)
+    words = np.zeros((n, 8), dtype=np.uint8)
+    if end > section.byte_idx:
+        words[:, : end - section.byte_idx] = payloads[
+            :, section.byte_idx : end
+        ]
+    words = words.view("<u8")[:, 0]
+    return (words >> np.uint64(section.bit_shift)) & np.uint64(section.mask)
+
+
+def _extract_raw(payloads, plan):
+    raw = _extract_section(payloads, plan.section)
+    if plan.extra is not None:
+        extra = _extract_section(payloads, plan.extra)
+        raw = raw + (extra << np.uint64(plan.extra.value_shift))
+    return raw
+
+
+def _scalar_column(spn, raw):
+    decoder: ScalarValue = spn.value_decoder
+    value = raw.astype(np.float64)
+    if decoder.scale:
+        value *= decoder.scale
+    if decoder.offset:
+        value += decoder.offset
+
+    status = np.full(raw.shape, BatchStatus.VALID, dtype=np.int8)
+    if decoder.min:
+        clipped = value < decoder.min
+        value[clipped] = decoder.min
+        status[clipped] = BatchStatus.CLIPPED_TO_MIN
+    if decoder.max:
+        clipped = value > decoder.max
+        value[clipped] = decoder.max
+        status[clipped] = BatchStatus.CLIPPED_TO_MAX
+
+    thresholds = decoder.range_thresholds()
+    if thresholds is not None:
+        codes = (
+            BatchStatus.NOT_AVAILABLE,
+            BatchStatus.ERROR_INDICATOR,
+            BatchStatus.PARAMETER_SPECIFIC,
+        )
+        # Check the least severe range first, so the more severe ones win
+        for thres, code in reversed(tuple(zip(thresholds, codes))):
+            in_range = raw >= np.uint64(thres)
+            value[in_range] = np.nan
+            status[in_range] = code
+
+    return BatchColumn(spn, raw, value, status)
+
+
+def _encoded_column(spn, raw):
+    decoder: EncodedValue = spn.value_decoder
+    unique, inverse = np.unique(raw, return_inverse=True)
+    lookup = np.empty(len(unique), dtype=object)
+    lookup[:] = [decoder.encodings.get(int(r)) for r in unique]
+    value = lookup[inverse.reshape(raw.shape)]
+
+    status = np.full(raw.shape, BatchStatus.VALID, dtype=np.int8)
+    status[np.equal(value, None)] = BatchStatus.NO_ENCODING
+    return BatchColumn(spn, raw, value, status)
+
+
+def decode_batch(pgn: PGN, payloads) -> Dict[int, BatchColumn]:
+    """
+    Decode many payloads of the same PGN at once.
+
+    Accepts an (N, L) uint8 array, or a list of equal length bytes, and
+    returns a dict of SPN id to BatchColumn, where each column holds the raw
+    values, the scaled values (or encoding names) and a BatchStatus code per
+    payload. Values that are not available, error indicators or parameter
+    specific are NaN in the value column.
+
+    Only fixed length PGNs are supported, and only the scalar and encoded
+    SPNs of up to 64 bits are decoded (i.e. text, byte array and custom SPNs
+    are not included in the result). If an SPN appears more than once in the
+    PGN, only the first occurrence is decoded.
+    """
+    if pgn.length.variable:
+        raise ValueError(
+            "PGN {} is variable length and cannot be batch decoded".format(
+                pgn.id
+            )
+        )
+
+    payloads = as_payload_array(payloads)
+    if not len(payloads):
+        # Nothing to decode, but still return an (empty) column per SPN
+        payloads = np.zeros((0, pgn.length.max_len), dtype=np.uint8)
+    columns = {}
+    for record in pgn.ordering_records:
+        if record.spn.id in columns:
+            continue
+        if not is_simple_numeric_record(record, pgn):
+            continue
+        plan, spn = record.location, record.spn
+        sections = [s for s in (plan.section, plan.extra) if s is not None]
+        if any(s.bit_shift + s.bit_len > 64 for s in sections):
+            continue
+
+        needed = max(s.byte_idx + s.min_bytes for s in sections)
+        if payloads.shape[1] < needed:
+            raise ValueError(
+                "not enough bytes for SPN {} - need {}, have {}".format(
+                    spn.id, needed, payloads.shape[1]
+                )
+            )
+
+        raw = _extract_raw(payloads, plan)
+        if isinstance(spn.value_decoder, ScalarValue):
+            columns[spn.id] = _scalar_column(spn, raw)
+        else:
+            columns[spn.id] = _encoded_column(spn, raw)
+
+    return columns
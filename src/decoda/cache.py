@@ -0,0 +1,175 @@
+# Copyright Andrew Dodd
+from collections import OrderedDict
+
+import attr
+
+from decoda.main import is_simple_numeric_record
+
+# Rough sizes (in bytes) used to keep the cache within its budget
+ENTRY_SIZE = 200
+DECODED_SPN_SIZE = 150
+
+
+@attr.s
+class CacheStats:
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    evictions = attr.ib(default=0)
+
+
+class DecodeCache:
+    """
+    A least recently used cache of decoded payloads, for PGNs that are sent
+    with the same payload over and over.
+
+    Entries are keyed on the PGN and payload bytes, and the least recently
+    used ones are evicted once the (estimated) size of all the entries goes
+    over max_bytes. If pgns is given, only those PGN ids are cached.
+
+    The DecodedSPNs of a cached result are shared between every decode that
+    hits it (each decode gets its own list).
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, pgns=None):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._pgns = None if pgns is None else frozenset(pgns)
+        # (PGN id, payload) -> (decoded, size)
+        self._entries = OrderedDict()
+        # PGN id -> CacheStats
+        self._stats = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def decode(self, pgn, payload):
+        pgn_id = pgn.id
+        if self._pgns is not None and pgn_id not in self._pgns:
+            return pgn.decode(payload)
+
+        stats = self._stats.get(pgn_id)
+        if stats is None:
+            stats = self._stats[pgn_id] = CacheStats()
+
+        key = (pgn_id, bytes(payload))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            stats.hits += 1
+            return list(entry[0])
+
+        stats.misses += 1
+        decoded = pgn.decode(payload)
+        size = ENTRY_SIZE + len(key[1]) + DECODED_SPN_SIZE * len(decoded)
+        if size <= self.max_bytes:
+            self._entries[key] = (decoded, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                (evicted_id, _), (_, evicted_size) = self._entries.popitem(
+                    last=False
+                )
+                self.size_bytes -= evicted_size
+                self._stats[evicted_id].evictions += 1
+        return list(decoded)
+
+    def stats(self, pgn_id=None):
+        """
+        The hit, miss and eviction counts of one PGN, or of all of them.
+        """
+        if pgn_id is not None:
+            return attr.evolve(self._stats.get(pgn_id, CacheStats()))
+        total = CacheStats()
+        for stats in self._stats.values():
+            total.hits += stats.hits
+            total.misses += stats.misses
+            total.evictions += stats.evictions
+        return total
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+
+def delta_layout(pgn):
+    """
+    The bits of the payload (as a little endian int) that each record of the
+    PGN is decoded from, and the payload length needed, or None if the
+    records cannot be decoded independently of each other.
+    """
+    records = pgn.ordering_records
+    if pgn.length.variable or not records:
+        return None
+    if not all(is_simple_numeric_record(record, pgn) for record in records):
+        return None
+
+    layout = []
+    payload_len = 0
+    for record in records:
+        bits = 0
+        plan = record.location
+        for section in (plan.section, plan.extra):
+            if section is not None:
+                shift = section.byte_idx * 8 + section.bit_shift
+                bits |= section.mask << shift
+                payload_len = max(
+                    payload_len, section.byte_idx + section.byte_span
+                )
+        layout.append((bits, record))
+    return tuple(layout), payload_len
+
+
+class DeltaDecoder:
+    """
+    Decodes each payload against the previous payload of the same PGN from
+    the same source address, only decoding the SPNs whose bits changed and
+    reusing the previous DecodedSPNs for the rest.
+
+    This applies to fixed length PGNs made up of scalar and encoded SPNs,
+    other PGNs are decoded as normal.
+    """
+
+    def __init__(self):
+        # PGN id -> delta_layout (or False)
+        self._layouts = {}
+        # (source address, PGN id) -> (payload, decoded)
+        self._previous = {}
+
+    def decode(self, sa, pgn, payload):
+        layout = self._layouts.get(pgn.id)
+        if layout is None:
+            layout = self._layouts[pgn.id] = delta_layout(pgn) or False
+        if not layout:
+            return pgn.decode(payload)
+
+        records, payload_len = layout
+        payload = bytes(payload)
+        key = (sa, pgn.id)
+        previous = self._previous.get(key)
+        if (
+            previous is None
+            or len(previous[0]) != len(payload)
+            or len(payload) < payload_len
+        ):
+            decoded = pgn.decode(payload)
+            if len(payload) >= payload_len and len(decoded) == len(records):
+                self._previous[key] = (payload, decoded)
+            return list(decoded)
+
+        previous_payload, decoded = previous
+        if previous_payload != payload:
+            changed = int.from_bytes(
+                previous_payload, "little"
+            ) ^ int.from_bytes(payload, "little")
+            decoded = list(decoded)
+            for idx, (bits, record) in enumerate(records):
+                if changed & bits:
+                    decoded[idx], _ = record.spn.decode(
+                        payload, record.location, False, -1
+                    )
+            self._previous[key] = (payload, decoded)
+        return list(decoded)
+
+    def clear(self):
+        self._previous.clear()
@@ -0,0 +1,26 @@
+# Copyright Andrew Dodd
+import argparse
+
+from decoda.spec_loader import compile_spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="decoda")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = commands.add_parser(
+        "compile-spec",
+        help="compile a JSON spec into the faster loading binary format",
+    )
+    compile_parser.add_argument("input_file", help="the JSON spec to compile")
+    compile_parser.add_argument(
+        "output_file", help="where to write the compiled spec"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "compile-spec":
+        compile_spec(args.input_file, args.output_file, warn_of_errors=True)
+
+
+if __name__ == "__main__":
+    main()
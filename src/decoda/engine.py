@@ -0,0 +1,239 @@
+# Copyright Andrew Dodd
+import functools
+import heapq
+import itertools
+import multiprocessing
+import os
+from operator import itemgetter
+
+from decoda.main import Address, DecodedSPN
+from decoda.spec_loader import load_from_file, spec_provider
+from decoda.transport import ConnectionManager, Decoda, Message
+
+# The kinds of result a shard sends back, each result is a tuple of
+# (timestamp, kind, ...)
+_MESSAGE = 0
+_ERROR = 1
+_DEFRAG_ERROR = 2
+
+
+def _load_spec(spec_path):
+    if spec_path is None:
+        return spec_provider.provide()
+    return load_from_file(spec_path, warn_of_errors=False)
+
+
+def _picklable(value):
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+def _pack_message(message):
+    # Messages refer to the spec objects, so only the ids and values are
+    # sent between processes (the display values are formatted again, if
+    # they are used, from the raw values and values)
+    if message.pgn is None:
+        return (
+            message.priority,
+            message.src_address.num,
+            message.dst_address.num,
+            None,
+            None,
+        )
+    decoded = tuple(
+        (d.spn.id, _picklable(d.raw), _picklable(d.value))
+        for d in message.decoded
+    )
+    return (
+        message.priority,
+        message.src_address.num,
+        message.dst_address.num,
+        message.pgn.id,
+        decoded,
+    )
+
+
+class _Shard:
+    """
+    The Decoda and ConnectionManager of one worker process.
+    """
+
+    def __init__(self, spec, publish_transport_frames):
+        self._results = []
+        self._timestamp = None
+        decoda = Decoda(spec, self._on_message, self._on_error)
+        self._cm = ConnectionManager(
+            decoda, self._on_defrag_error, publish_transport_frames
+        )
+
+    def handle_frames(self, frames):
+        self._results = results = []
+        for timestamp, can_id, payload in frames:
+            self._timestamp = timestamp
+            self._cm.handle_frame(can_id, payload, timestamp)
+        return results
+
+    def _on_message(self, message):
+        self._results.append(
+            (self._timestamp, _MESSAGE) + _pack_message(message)
+        )
+
+    def _on_error(self, error):
+        self._results.append((self._timestamp, _ERROR, error))
+
+    def _on_defrag_error(self, reason, info):
+        if isinstance(info, Message):
+            info = _pack_message(info)
+        else:
+            info = {k: v for k, v in info.items() if k != "data"}
+        self._results.append((self._timestamp, _DEFRAG_ERROR, reason, info))
+
+
+def _run_shard(connection, spec_path, publish_transport_frames):
+    shard = _Shard(_load_spec(spec_path), publish_transport_frames)
+    while True:
+        frames = connection.recv()
+        if frames is None:
+            break
+        connection.send(shard.handle_frames(frames))
+    connection.close()
+
+
+class ShardedDecoda:
+    """
+    Decodes frames across a number of worker processes.
+
+    Frames are sharded by source address, and each worker has its own spec
+    (loaded from spec_path, or by the spec_provider) and ConnectionManager,
+    so that transport sessions stay within one worker. Only the sender's
+    frames are needed to reassemble a session, so a CTS from the receiver
+    (which goes to the receiver's shard) does not affect reassembly, except
+    that retransmission requests are not followed.
+
+    handle_frames takes an iterable of (timestamp, can_id, payload), sends
+    them to the workers in chunks of chunk_size frames, and yields the
+    decoded Messages merged back into timestamp order (as long as the frames
+    were in timestamp order). Errors are passed to the error handlers.
+    """
+
+    def __init__(
+        self,
+        spec_path=None,
+        processes=None,
+        error_handler=None,
+        defragmenting_error_callback=None,
+        publish_transport_frames=True,
+        chunk_size=4096,
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+
+        self.__spec__ = _load_spec(spec_path)
+        self._handle_error = (
+            error_handler if error_handler else lambda x: print(x)
+        )
+        self._handle_defrag_error = (
+            defragmenting_error_callback
+            if defragmenting_error_callback
+            else lambda *x: print(*x)
+        )
+        self._chunk_size = chunk_size
+        self._pgns = {}
+        self._spns = {}
+
+        context = multiprocessing.get_context()
+        self._connections = []
+        self._processes = []
+        for _ in range(processes or os.cpu_count() or 1):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_run_shard,
+                args=(worker_connection, spec_path, publish_transport_frames),
+                daemon=True,
+            )
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def handle_frames(self, frames):
+        frames = iter(frames)
+        while True:
+            chunk = list(itertools.islice(frames, self._chunk_size))
+            if not chunk:
+                return
+            yield from self._decode_chunk(chunk)
+
+    def _decode_chunk(self, chunk):
+        shards = [[] for _ in self._connections]
+        shard_count = len(shards)
+        for frame in chunk:
+            shards[(frame[1] & 0xFF) % shard_count].append(frame)
+
+        busy = []
+        for connection, frames in zip(self._connections, shards):
+            if frames:
+                connection.send(frames)
+                busy.append(connection)
+        results = [connection.recv() for connection in busy]
+
+        for result in heapq.merge(*results, key=itemgetter(0)):
+            kind = result[1]
+            if kind == _MESSAGE:
+                yield self._unpack_message(result[0], result[2:])
+            elif kind == _ERROR:
+                self._handle_error(result[2])
+            else:
+                reason, info = result[2:]
+                if isinstance(info, tuple):
+                    info = self._unpack_message(result[0], info)
+                self._handle_defrag_error(reason, info)
+
+    def _unpack_message(self, timestamp, packed):
+        priority, sa, da, pgn_id, decoded = packed
+        pgn = None
+        if pgn_id is not None:
+            pgn = self._pgns.get(pgn_id)
+            if pgn is None:
+                pgn = self.__spec__.PGNs.get_by_id(pgn_id)
+                self._pgns[pgn_id] = pgn
+            decoded = [
+                self._decoded_spn(self._spn(spn_id), raw, value)
+                for spn_id, raw, value in decoded
+            ]
+        return Message(
+            priority,
+            Address.from_num(sa),
+            Address.from_num(da),
+            pgn,
+            decoded,
+            None,
+            timestamp,
+        )
+
+    @staticmethod
+    def _decoded_spn(spn, raw, value):
+        display_value = functools.partial(
+            spn.value_decoder.display_value_for, raw, value
+        )
+        return DecodedSPN(spn, raw, value, display_value)
+
+    def _spn(self, spn_id):
+        spn = self._spns.get(spn_id)
+        if spn is None:
+            spn = self._spns[spn_id] = self.__spec__.SPNs.get_by_id(spn_id)
+        return spn
@@ -0,0 +1,270 @@
+# Copyright Andrew Dodd
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from decoda.batch import BatchStatus, decode_batch
+from decoda.exceptions import UnknownReferenceError
+from decoda.main import (
+    ByteArrayValue,
+    EncodedValue,
+    ScalarValue,
+    is_simple_numeric_record,
+)
+from decoda.transport import parts_from_can_id
+
+RANGE_STATUSES = {
+    "Not available": BatchStatus.NOT_AVAILABLE,
+    "Error indicator": BatchStatus.ERROR_INDICATOR,
+    "Parameter specific indicator": BatchStatus.PARAMETER_SPECIFIC,
+}
+
+
+def _column_type(spn):
+    if isinstance(spn.value_decoder, ScalarValue):
+        return pa.float64()
+    if isinstance(spn.value_decoder, ByteArrayValue):
+        return pa.binary()
+    return pa.string()
+
+
+def _status_from_decoded(decoded):
+    # The same checks as batch._scalar_column, from the raw value
+    decoder = decoded.spn.value_decoder
+    indicator = decoder.range_indicator(decoded.raw)
+    if indicator is not None:
+        return RANGE_STATUSES[indicator[0]]
+
+    value = decoded.raw
+    if decoder.scale:
+        value *= decoder.scale
+    if decoder.offset:
+        value += decoder.offset
+    if decoder.min and value < decoder.min:
+        return BatchStatus.CLIPPED_TO_MIN
+    if decoder.max and value > decoder.max:
+        return BatchStatus.CLIPPED_TO_MAX
+    return BatchStatus.VALID
+
+
+class PGNColumnBuffer:
+    """
+    The rows received for one PGN, waiting to be written as a row group.
+
+    Rows are either raw payloads (decoded together with decode_batch when the
+    buffer is flushed), or the DecodedSPNs of messages that were decoded one
+    at a time by Decoda.
+    """
+
+    def __init__(self, pgn):
+        self.pgn = pgn
+        spns = {}
+        for record in pgn.ordering_records:
+            spns.setdefault(record.spn.id, record.spn)
+        self.spns = list(spns.values())
+
+        fields = [
+            pa.field("timestamp", pa.float64()),
+            pa.field("source_address", pa.uint8()),
+        ]
+        for spn in self.spns:
+            fields.append(pa.field(str(spn.id), _column_type(spn)))
+            if isinstance(spn.value_decoder, ScalarValue):
+                fields.append(pa.field("{}_status".format(spn.id), pa.int8()))
+        self.schema = pa.schema(fields)
+        self._clear()
+
+    def _clear(self):
+        self.timestamps = []
+        self.source_addresses = []
+        self.payloads = []
+        self.decoded = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add_payload(self, timestamp, source_address, payload):
+        self.timestamps.append(timestamp)
+        self.source_addresses.append(source_address)
+        self.payloads.append(payload)
+        self.decoded.append(None)
+
+    def add_decoded(self, timestamp, source_address, decoded):
+        self.timestamps.append(timestamp)
+        self.source_addresses.append(source_address)
+        self.payloads.append(None)
+        self.decoded.append(decoded)
+
+    def take_table(self):
+        """
+        Build a table from the buffered rows, and empty the buffer.
+        """
+        rows = len(self)
+        batch_rows = [i for i, p in enumerate(self.payloads) if p is not None]
+        batch_columns = {}
+        if batch_rows:
+            batch_columns = decode_batch(
+                self.pgn, [self.payloads[i] for i in batch_rows]
+            )
+
+        columns = [
+            pa.array(self.timestamps, type=pa.float64()),
+            pa.array(self.source_addresses, type=pa.uint8()),
+        ]
+        for spn in self.spns:
+            is_scalar = isinstance(spn.value_decoder, ScalarValue)
+            if is_scalar:
+                values = np.full(rows, np.nan)
+                statuses = np.zeros(rows, dtype=np.int8)
+            else:
+                values = np.full(rows, None, dtype=object)
+
+            batch_column = batch_columns.get(spn.id)
+            if batch_column is not None:
+                values[batch_rows] = batch_column.value
+                if is_scalar:
+                    statuses[batch_rows] = batch_column.status
+
+            for row, decoded in enumerate(self.decoded):
+                if decoded is None:
+                    continue
+                found = next((d for d in decoded if d.id == spn.id), None)
+                if found is None:
+                    continue
+                if is_scalar:
+                    statuses[row] = _status_from_decoded(found)
+                    if not isinstance(found.value, str):
+                        values[row] = found.value
+                elif isinstance(spn.value_decoder, ByteArrayValue):
+                    values[row] = bytes(found.value)
+                elif found.value is not None:
+                    values[row] = str(found.value)
+
+            columns.append(pa.array(values, type=_column_type(spn)))
+            if is_scalar:
+                columns.append(pa.array(statuses, type=pa.int8()))
+
+        self._clear()
+        return pa.Table.from_arrays(columns, schema=self.schema)
+
+
+class ColumnarExporter:
+    """
+    Writes decoded frames into one columnar file per PGN.
+
+    Each file has a timestamp and source_address column, plus a column per
+    SPN id (and a "<id>_status" column holding the BatchStatus for scalar
+    SPNs). Rows are buffered per PGN and written in row groups of at most
+    row_group_size rows, in either "parquet" or Arrow IPC ("arrow") format.
+
+    Fixed length PGNs made up of scalar and encoded SPNs are not decoded per
+    frame at all, their payloads are buffered and decoded with decode_batch
+    when the row group is written. All other frames go through the Decoda
+    instance (whose callback is replaced by this exporter), so that they can
+    also be used with a ConnectionManager.
+    """
+
+    def __init__(
+        self, decoda, directory, file_format="parquet", row_group_size=65536
+    ):
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError("file_format must be 'parquet' or 'arrow'")
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be positive")
+
+        self._decoda = decoda
+        self._spec = decoda.__spec__
+        self._directory = directory
+        self._file_format = file_format
+        self._row_group_size = row_group_size
+        self._timestamp = None
+        self._batch_lengths = {}
+        self._buffers = {}
+        self._writers = {}
+        decoda.set_callback(self.handle_message)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def handle_frame(self, timestamp, can_id, payload):
+        self._timestamp = timestamp
+        priority, pgn_id, sa, da = parts_from_can_id(can_id)
+
+        batch_length = self._batch_lengths.get(pgn_id)
+        if batch_length is None:
+            batch_length = self._batch_length(pgn_id)
+            self._batch_lengths[pgn_id] = batch_length
+
+        if batch_length and len(payload) == batch_length:
+            buffer = self._buffer_for(self._spec.PGNs.get_by_id(pgn_id))
+            buffer.add_payload(timestamp, sa.num, bytes(payload))
+            self._flush_if_full(buffer)
+        else:
+            self._decoda.handle_frame(can_id, payload)
+
+    def handle_message(self, message):
+        buffer = self._buffer_for(message.pgn)
+        buffer.add_decoded(
+            self._timestamp, message.src_address.num, message.decoded
+        )
+        self._flush_if_full(buffer)
+
+    def flush(self):
+        for buffer in self._buffers.values():
+            if len(buffer):
+                self._write(buffer)
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def _batch_length(self, pgn_id):
+        try:
+            pgn = self._spec.PGNs.get_by_id(pgn_id)
+        except UnknownReferenceError:
+            return 0
+        if pgn.length.variable or not pgn.ordering_records:
+            return 0
+        if not all(
+            is_simple_numeric_record(record, pgn)
+            for record in pgn.ordering_records
+        ):
+            return 0
+        return pgn.length.max_len
+
+    def _buffer_for(self, pgn):
+        buffer = self._buffers.get(pgn.id)
+        if buffer is None:
+            buffer = PGNColumnBuffer(pgn)
+            self._buffers[pgn.id] = buffer
+        return buffer
+
+    def _flush_if_full(self, buffer):
+        if len(buffer) >= self._row_group_size:
+            self._write(buffer)
+
+    def _write(self, buffer):
+        table = buffer.take_table()
+        writer = self._writers.get(buffer.pgn.id)
+        if writer is None:
+            path = os.path.join(
+                self._directory,
+                "pgn_{}.{}".format(buffer.pgn.id, self._file_format),
+            )
+            if self._file_format == "parquet":
+                writer = pq.ParquetWriter(path, buffer.schema)
+            else:
+                writer = pa.ipc.new_file(path, buffer.schema)
+            self._writers[buffer.pgn.id] = writer
+
+        if self._file_format == "parquet":
+            writer.write_table(table, row_group_size=self._row_group_size)
+        else:
+            writer.write_table(table)
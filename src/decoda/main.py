@@ -1,8 +1,10 @@
 # Copyright Andrew Dodd
+import abc
+import bisect
+import functools
 import math
 from binascii import hexlify
-from numbers import Number
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 import attr
 
@@ -71,8 +73,154 @@ def convert_to_int(i: Any) -> int:
     return int(i, 10)
 
 
-def convert_encodings(value: Dict) -> Dict:
-    encodings = {}
+class Encodings(abc.ABC):
+    """
+    A read-only, dict-like lookup from raw value to encoding name.
+    """
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def get(self, raw, default=None):
+        pass
+
+    @abc.abstractmethod
+    def ranges(self):
+        """
+        Yields (start, end, value) for each run of raw values (end is
+        exclusive).
+        """
+
+    def items(self):
+        for start, end, value in self.ranges():
+            for raw in range(start, end):
+                yield raw, value
+
+    def __len__(self):
+        return sum(end - start for start, end, _ in self.ranges())
+
+    def __getitem__(self, raw):
+        value = self.get(raw)
+        if value is None:
+            raise KeyError(raw)
+        return value
+
+    def __contains__(self, raw):
+        return self.get(raw) is not None
+
+    def __eq__(self, other):
+        if not isinstance(other, Encodings):
+            return NotImplemented
+        return self._merged_ranges() == other._merged_ranges()
+
+    def _merged_ranges(self):
+        # The ranges with touching runs of the same value joined up, so that
+        # equal encodings compare equal however they are held
+        merged = []
+        for start, end, value in self.ranges():
+            if merged and merged[-1][1] == start and merged[-1][2] == value:
+                merged[-1] = (merged[-1][0], end, value)
+            else:
+                merged.append((start, end, value))
+        return merged
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, list(self.ranges()))
+
+
+class IntervalEncodings(Encodings):
+    """
+    Encodings held as sorted, non-overlapping ranges, found with a bisect.
+    """
+
+    __slots__ = ("starts", "ends", "values")
+
+    def __init__(self, starts, ends, values):
+        self.starts = starts
+        self.ends = ends
+        self.values = values
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """
+        Build from (start, end, value) ranges, where later ranges take
+        precedence over earlier ones if they overlap.
+        """
+        ranges = [r for r in ranges if r[0] < r[1]]
+        ordered = sorted(ranges, key=lambda r: r[0])
+        overlapping = any(
+            later[0] < earlier[1]
+            for earlier, later in zip(ordered, ordered[1:])
+        )
+        if overlapping:
+            # Split at every boundary and let the last range covering each
+            # piece win (as if they had been written into a dict in order)
+            bounds = sorted(
+                {b for start, end, _ in ranges for b in (start, end)}
+            )
+            ordered = []
+            for start, end in zip(bounds, bounds[1:]):
+                for r_start, r_end, value in reversed(ranges):
+                    if r_start <= start and end <= r_end:
+                        ordered.append((start, end, value))
+                        break
+
+        return cls(
+            tuple(r[0] for r in ordered),
+            tuple(r[1] for r in ordered),
+            tuple(r[2] for r in ordered),
+        )
+
+    def get(self, raw, default=None):
+        idx = bisect.bisect_right(self.starts, raw) - 1
+        if idx >= 0 and raw < self.ends[idx]:
+            return self.values[idx]
+        return default
+
+    def ranges(self):
+        return zip(self.starts, self.ends, self.values)
+
+
+class DenseEncodings(Encodings):
+    """
+    Encodings held in a tuple indexed by the raw value, for small bit lengths.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def from_encodings(cls, encodings, size):
+        return cls(tuple(encodings.get(raw) for raw in range(size)))
+
+    def get(self, raw, default=None):
+        if 0 <= raw < len(self.table):
+            value = self.table[raw]
+            if value is not None:
+                return value
+        return default
+
+    def ranges(self):
+        start = None
+        for raw, value in enumerate(self.table + (None,)):
+            if start is not None and value != self.table[start]:
+                yield start, raw, self.table[start]
+                start = None
+            if start is None and value is not None:
+                start = raw
+
+
+# The widest SPNs that get a DenseEncodings table
+DENSE_ENCODING_MAX_BITS = 8
+
+
+def convert_encodings(value: Dict) -> Encodings:
+    if isinstance(value, Encodings):
+        return value
+
+    ranges = []
     for k, v in value.items():
         if isinstance(k, str) and "-" in k:
             start, end = k.split("-")
@@ -80,17 +228,27 @@ def convert_encodings(value: Dict) -> Dict:
             start = k
             end = k
 
-        start_int = convert_to_int(start)
-        end_int = convert_to_int(end) + 1
+        ranges.append((convert_to_int(start), convert_to_int(end) + 1, v))
+    return IntervalEncodings.from_ranges(ranges)
 
-        for k in range(start_int, end_int):
-            encodings[k] = v
-    return encodings
+
+def display_value_of(display_value, lazy_display):
+    """
+    The decoders hand back a callable for the display value, this either
+    formats it now, or leaves it to be formatted on demand.
+    """
+    return display_value if lazy_display else display_value()
+
+
+def encoded_display_value(value, raw):
+    if value:
+        return "{} ({})".format(value, raw)
+    return "No encoding ({})".format(raw)
 
 
 @attr.s(frozen=True)
 class EncodedValue:
-    encodings: Dict = attr.ib(converter=convert_encodings)
+    encodings: Encodings = attr.ib(converter=convert_encodings)
     bit_length = attr.ib()
 
     @encodings.validator
@@ -103,25 +261,62 @@ class EncodedValue:
         if value.max_len is None or value.max_len < 1:
             raise ValueError("must have positive bit length")
 
+    def __attrs_post_init__(self):
+        max_len = self.bit_length.max_len
+        if max_len <= DENSE_ENCODING_MAX_BITS and not isinstance(
+            self.encodings, DenseEncodings
+        ):
+            dense = DenseEncodings.from_encodings(self.encodings, 1 << max_len)
+            object.__setattr__(self, "encodings", dense)
+
     def decode_from_raw(
-        self, value, start_spec, variable_pgn, prev_spn_ended, *args, **kwargs
+        self,
+        value,
+        start_spec,
+        variable_pgn,
+        prev_spn_ended,
+        *args,
+        lazy_display=False,
+        **kwargs,
     ):
         bit_len = self.bit_length.expected_length(variable_pgn)
         raw, end_byte_idx = extract_value_at_location(
             value, start_spec, bit_len
         )
         value = self.encodings.get(raw)
-        if value:
-            display_value = "{} ({})".format(value, raw)
-        else:
-            display_value = "No encoding ({})".format(raw)
+        display_value = functools.partial(encoded_display_value, value, raw)
 
         return {
             "raw": raw,
             "value": value,
-            "display_value": display_value,
+            "display_value": display_value_of(display_value, lazy_display),
         }, end_byte_idx
 
+    def display_value_for(self, raw, value):
+        """
+        The display value of a decoded raw value and value.
+        """
+        return encoded_display_value(value, raw)
+
+
+RANGE_INDICATOR_NAMES = (
+    "Not available",
+    "Error indicator",
+    "Parameter specific indicator",
+)
+
+RANGE_INDICATOR_ERRORS = {
+    "Not available": NotAvaiableRangeError,
+    "Error indicator": ErrorIndicatorRangeError,
+    "Parameter specific indicator": ParameterSpecificIndicatorError,
+}
+
+
+def range_indicator_display_value(name, error_code):
+    if error_code is None:
+        return name
+    return f"{name} ({error_code})"
+
 
 @attr.s(frozen=True)
 class ScalarValue:
@@ -131,6 +326,8 @@ class ScalarValue:
     offset = attr.ib()
     scale = attr.ib()
     bit_length = attr.ib()
+    # Precomputed from bit_length, see range_thresholds
+    _thresholds = attr.ib(init=False, eq=False, repr=False)
 
     @bit_length.validator
     def _check_bit_length(self, attribute, value):
@@ -140,39 +337,59 @@ class ScalarValue:
     def __attrs_post_init__(self):
         if self.min and self.max and not self.min < self.max:
             raise ValueError("min must be less than max")
+        object.__setattr__(self, "_thresholds", self._compute_thresholds())
 
-    def as_display_value(self, value):
-        return "{} {}".format(value, self.units) if self.units else str(value)
-
-    def check_in_valid_range(self, raw):
-        not_available_thres = 0xFF
-        error_ind_thres = 0xFE
-        param_specific_thres = 0xFB
-        format_offset = lambda val, thres: val - thres
-
+    def _compute_thresholds(self):
         if self.bit_length.is_equivalent_to(8):
-            format_offset = lambda val, thres: None
+            shift = 0
         elif self.bit_length.is_equivalent_to(16):
-            not_available_thres <<= 8
-            error_ind_thres <<= 8
-            param_specific_thres <<= 8
+            shift = 8
         elif self.bit_length.is_equivalent_to(32):
-            not_available_thres <<= 24
-            error_ind_thres <<= 24
-            param_specific_thres <<= 24
+            shift = 24
         else:
-            return
+            return None
+        return 0xFF << shift, 0xFE << shift, 0xFB << shift
 
-        if raw >= not_available_thres:
-            raise NotAvaiableRangeError(
-                format_offset(raw, not_available_thres)
-            )
-        if raw >= error_ind_thres:
-            raise ErrorIndicatorRangeError(format_offset(raw, error_ind_thres))
-        if raw >= param_specific_thres:
-            raise ParameterSpecificIndicatorError(
-                format_offset(raw, param_specific_thres)
-            )
+    def as_display_value(self, value):
+        return "{} {}".format(value, self.units) if self.units else str(value)
+
+    def clipped_display_value(self, limit_name, limit, encoded_value):
+        return "{} (encoded value {} was clipped to {})".format(
+            self.as_display_value(limit),
+            self.as_display_value(encoded_value),
+            limit_name,
+        )
+
+    def range_thresholds(self):
+        """
+        The (not available, error indicator, parameter specific) thresholds
+        for raw values, or None if the bit length does not reserve them.
+        """
+        return self._thresholds
+
+    def range_indicator(self, raw):
+        """
+        Which reserved range the raw value is in, without raising.
+
+        Returns None for a normal value, otherwise a tuple of the range name
+        (i.e. the decoded value, e.g. "Not available") and the error code
+        (the offset into the range, None for 8-bit values).
+        """
+        thresholds = self._thresholds
+        if thresholds is None or raw < thresholds[2]:
+            return None
+
+        for name, thres in zip(RANGE_INDICATOR_NAMES, thresholds):
+            if raw >= thres:
+                if self.bit_length.is_equivalent_to(8):
+                    return name, None
+                return name, raw - thres
+
+    def check_in_valid_range(self, raw):
+        indicator = self.range_indicator(raw)
+        if indicator is not None:
+            name, error_code = indicator
+            raise RANGE_INDICATOR_ERRORS[name](error_code)
 
     def decode_from_raw(
         self,
@@ -181,6 +398,7 @@ class ScalarValue:
         variable_pgn,
         prev_spn_ended,
         ignore_range=False,
+        lazy_display=False,
         **kwargs,
     ):
         bit_len = self.bit_length.expected_length(variable_pgn)
@@ -188,9 +406,13 @@ class ScalarValue:
             value, start_spec, bit_len
         )
 
-        try:
-            self.check_in_valid_range(raw)
-
+        thresholds = self._thresholds
+        if thresholds is not None and raw >= thresholds[2]:
+            value, error_code = self.range_indicator(raw)
+            display_value = functools.partial(
+                range_indicator_display_value, value, error_code
+            )
+        else:
             value = raw
             if self.scale:
                 value *= self.scale
@@ -198,40 +420,46 @@ class ScalarValue:
             if self.offset:
                 value += self.offset
 
-            display_value = self.as_display_value(value)
+            display_value = functools.partial(self.as_display_value, value)
 
             if not ignore_range:
                 if self.min and value < self.min:
-                    display_value = (
-                        "{} (encoded value {} was clipped to min)".format(
-                            self.as_display_value(self.min),
-                            self.as_display_value(value),
-                        )
+                    display_value = functools.partial(
+                        self.clipped_display_value, "min", self.min, value
                     )
                     value = self.min
                 if self.max and value > self.max:
-                    display_value = (
-                        "{} (encoded value {} was clipped to max)".format(
-                            self.as_display_value(self.max),
-                            self.as_display_value(value),
-                        )
+                    display_value = functools.partial(
+                        self.clipped_display_value, "max", self.max, value
                     )
                     value = self.max
 
-        except (
-            NotAvaiableRangeError,
-            ErrorIndicatorRangeError,
-            ParameterSpecificIndicatorError,
-        ) as e:
-            value = e.value()
-            display_value = e.display_value()
-
         return {
             "raw": raw,
             "value": value,
-            "display_value": display_value,
+            "display_value": display_value_of(display_value, lazy_display),
         }, end_byte_idx
 
+    def display_value_for(self, raw, value):
+        """
+        The display value of a decoded raw value and value (as decoded with
+        the range checked).
+        """
+        indicator = self.range_indicator(raw)
+        if indicator is not None:
+            return range_indicator_display_value(*indicator)
+
+        encoded_value = raw
+        if self.scale:
+            encoded_value *= self.scale
+        if self.offset:
+            encoded_value += self.offset
+        if self.min and encoded_value < self.min:
+            return self.clipped_display_value("min", self.min, encoded_value)
+        if self.max and encoded_value > self.max:
+            return self.clipped_display_value("max", self.max, encoded_value)
+        return self.as_display_value(value)
+
 
 def convert_if_hex(value: str) -> Optional[str]:
     if value is None:
@@ -303,12 +531,11 @@ class TextValue:
 
         return {"raw": val, "value": val, "display_value": val}, end_byte_idx
 
+    def display_value_for(self, raw, value):
+        return value
+
     def _get_start(self, start_spec, prev_spn_ended):
-        start = start_spec.split()[0].split("-")[0]
-        try:
-            return int(start) - 1
-        except ValueError:
-            return prev_spn_ended + 1
+        return as_extraction_plan(start_spec).start_idx(prev_spn_ended)
 
 
 @attr.s(frozen=True)
@@ -316,23 +543,28 @@ class ByteArrayValue:
     bit_length = attr.ib()
 
     def decode_from_raw(
-        self, value, start_spec, variable_pgn, prev_spn_ended, *args, **kwargs
+        self,
+        value,
+        start_spec,
+        variable_pgn,
+        prev_spn_ended,
+        *args,
+        lazy_display=False,
+        **kwargs,
     ):
-        start = start_spec.split()[0].split("-")[0]
-        try:
-            start_idx = int(start) - 1
-        except ValueError:
-            start_idx = prev_spn_ended + 1
-
+        start_idx = as_extraction_plan(start_spec).start_idx(prev_spn_ended)
         val = value[start_idx:]
         end_byte_idx = start_idx + len(val)
 
         return {
             "raw": val,
             "value": val,
-            "display_value": val.hex(),
+            "display_value": display_value_of(val.hex, lazy_display),
         }, end_byte_idx
 
+    def display_value_for(self, raw, value):
+        return value.hex()
+
 
 @attr.s(frozen=True)
 class CustomFunctionValue:
@@ -349,6 +581,7 @@ class CustomFunctionValue:
         prev_spn_ended,
         *args,
         already_decoded=None,
+        lazy_display=False,
         **kwargs,
     ):
         bit_len = self.bit_length.expected_length(variable_pgn)
@@ -369,12 +602,16 @@ class CustomFunctionValue:
         if val is None:
             return None, prev_spn_ended
 
+        display_value = functools.partial("{} ({})".format, val, raw)
         return {
             "raw": raw,
             "value": val,
-            "display_value": f"{val} ({raw})",
+            "display_value": display_value_of(display_value, lazy_display),
         }, end_byte_idx
 
+    def display_value_for(self, raw, value):
+        return "{} ({})".format(value, raw)
+
 
 @attr.s(frozen=True)
 class SPNFields:
@@ -396,6 +633,7 @@ class SPN(SPNFields):
         *args,
         **kwargs,
     ):
+        kwargs.setdefault("lazy_display", True)
         decoded, end_byte_idx = self.value_decoder.decode_from_raw(
             value,
             start_spec,
@@ -406,30 +644,101 @@ class SPN(SPNFields):
         )
         if decoded is None:
             return None, prev_spn_ended_idx
-        return DecodedSPN.build(self, **decoded), end_byte_idx
+        return (
+            DecodedSPN(
+                self,
+                decoded["raw"],
+                decoded["value"],
+                decoded["display_value"],
+            ),
+            end_byte_idx,
+        )
 
 
-@attr.s(frozen=True)
-class DecodedSPN(SPNFields):
-    raw: Number = attr.ib()
-    value: Union[Number, str] = attr.ib()
-    display_value: str = attr.ib()
+class DecodedSPN:
+    """
+    The decoded value of an SPN.
+
+    This refers to the (shared) SPN, rather than copying its fields, and the
+    display_value can be supplied as a callable so that it is only formatted
+    if it is used. It uses __slots__ as a lot of these get made, and should be
+    treated as immutable.
+    """
+
+    __slots__ = ("spn", "raw", "value", "_display_value")
+
+    def __init__(
+        self,
+        spn: SPN,
+        raw: Any,
+        value: Any,
+        display_value: Union[str, Callable[[], str]],
+    ):
+        self.spn = spn
+        self.raw = raw
+        self.value = value
+        self._display_value = display_value
 
     @classmethod
     def build(
         cls,
         spn: SPN,
-        raw: Number,
-        value: Union[Number, str],
-        display_value: str,
+        raw: Any,
+        value: Any,
+        display_value: Union[str, Callable[[], str]],
     ):
-        return cls(
-            id=spn.id,
-            name=spn.name,
-            description=spn.description,
-            raw=raw,
-            value=value,
-            display_value=display_value,
+        return cls(spn, raw, value, display_value)
+
+    @property
+    def id(self):
+        return self.spn.id
+
+    @property
+    def name(self):
+        return self.spn.name
+
+    @property
+    def description(self):
+        return self.spn.description
+
+    @property
+    def display_value(self) -> str:
+        display_value = self._display_value
+        if callable(display_value):
+            display_value = display_value()
+            self._display_value = display_value
+        return display_value
+
+    def _fields(self):
+        return (
+            self.id,
+            self.name,
+            self.description,
+            self.raw,
+            self.value,
+            self.display_value,
+        )
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __reduce__(self):
+        return self.__class__, (
+            self.spn,
+            self.raw,
+            self.value,
+            self.display_value,
+        )
+
+    def __repr__(self):
+        return (
+            "DecodedSPN(id={!r}, name={!r}, description={!r}, raw={!r}, "
+            "value={!r}, display_value={!r})".format(*self._fields())
         )
 
     def __str__(self):
@@ -454,9 +763,11 @@ def order_start_positions(start_pos_spec):
 
 # We need this because our decoding relies on the order of the records
 class OrderingRecord:
-    def __init__(self, start, spn):
+    def __init__(self, start, spn, location=None):
         self.start = start
         self.spn = spn
+        # The compiled ExtractionPlan for "start" (falls back to the raw spec)
+        self.location = start if location is None else location
 
     def __repr__(self):
         return "OrderingRecord({}, {})".format(self.start, self.spn)
@@ -490,16 +801,100 @@ def mask(length):
     return (1 << length) - 1
 
 
-def extract_value_at_location(payload, location, bit_length):
+@attr.s(frozen=True, slots=True)
+class LocationSection:
+    """
+    A run of contiguous bits in a payload, i.e. one part of a location spec
+    with all of the string parsing already done.
     """
-    Extract a "numeric" payload from the byte array at the provided location
 
-    Returns: (value, last_byte_idx)
+    byte_idx: int = attr.ib()
+    bit_shift: int = attr.ib()
+    mask: int = attr.ib()
+    byte_span: int = attr.ib()
+    # the number of bytes that must be present from byte_idx onwards
+    min_bytes: int = attr.ib()
+    bit_len: int = attr.ib()
+    # where the extracted bits are placed in the final value
+    value_shift: int = attr.ib(default=0)
+
+    @property
+    def last_byte_idx(self):
+        return self.byte_idx + self.byte_span - 1
+
+    def extract(self, payload):
+        byte_idx = self.byte_idx
+        if self.min_bytes and len(payload) - byte_idx < self.min_bytes:
+            raise ValueError(
+                "not enough bits for SPN - need {}, from {}.{} in payload[{}]".format(
+                    self.bit_len,
+                    byte_idx,
+                    byte_idx,
+                    hexlify(payload[byte_idx:]),
+                )
+            )
 
-    where
-     - value: the "bit_length" at "location" from the payload, and
-     - last_byte_idx: is the index of the last byte that the value was in.
+        v = int.from_bytes(
+            payload[byte_idx : byte_idx + self.byte_span], byteorder="little"
+        )
+        return (v >> self.bit_shift) & self.mask
+
+
+@attr.s(frozen=True, slots=True)
+class ExtractionPlan:
     """
+    A location spec (e.g. "3-4, 5.6") compiled for a particular bit length.
+
+    The plan is built once when the spec is loaded, so that decoding a frame
+    does not need to re-parse the location string.
+
+    - section: the (first) contiguous run of bits
+    - extra: the second run of bits for split fields (or None)
+    - first_byte_idx: the byte that byte oriented values (i.e. text and byte
+      arrays) start at, or None if they follow on from the previous SPN
+    """
+
+    location: str = attr.ib()
+    bit_length = attr.ib()
+    section: Optional[LocationSection] = attr.ib()
+    extra: Optional[LocationSection] = attr.ib()
+    first_byte_idx: Optional[int] = attr.ib()
+
+    def start_idx(self, prev_spn_ended):
+        if self.first_byte_idx is None:
+            return prev_spn_ended + 1
+        return self.first_byte_idx
+
+    def extract(self, payload):
+        section = self.section
+        if section is None:
+            # The location could not be compiled, parse it again to raise the
+            # original error
+            _compile_sections(self.location, self.bit_length)
+            raise UnsupportedLocationSpec(self.location)
+
+        value = section.extract(payload)
+        extra = self.extra
+        if extra is None:
+            return value, section.last_byte_idx
+
+        value += extra.extract(payload) << extra.value_shift
+        return value, extra.last_byte_idx
+
+
+def _make_section(byte, bit, bit_length):
+    min_bytes = 0 if bit_length.variable else bit_length.max_len // 8
+    return LocationSection(
+        byte_idx=byte,
+        bit_shift=bit,
+        mask=mask(bit_length.max_len),
+        byte_span=math.ceil((bit + bit_length.max_len) / 8.0),
+        min_bytes=min_bytes,
+        bit_len=bit_length.max_len,
+    )
+
+
+def _compile_sections(location, bit_length):
     sections = [s.strip() for s in location.split(",")]
     if len(sections) > 1:
         if len(sections) > 2:
@@ -524,42 +919,25 @@ def extract_value_at_location(payload, location, bit_length):
             # It appears to be a new spec?
             contiguous_length = 9 - int(contiguous.split(".")[1])
 
-        contiguous_value, _ = extract_value_at_location(
-            payload, contiguous, BitLength(contiguous_length)
+        contiguous_section, _ = _compile_sections(
+            contiguous, BitLength(contiguous_length)
         )
-        extra_value, last_byte_idx = extract_value_at_location(
-            payload, extra, BitLength(bit_length.max_len - contiguous_length)
+        extra_section, _ = _compile_sections(
+            extra, BitLength(bit_length.max_len - contiguous_length)
+        )
+        return contiguous_section, attr.evolve(
+            extra_section, value_shift=contiguous_length
         )
-        extra_value <<= contiguous_length
-
-        return extra_value + contiguous_value, last_byte_idx
 
     section = sections[0]
     if "-" not in section:
         # single byte
         byte, bit = byte_and_bit_from_num(section)
-        byte -= 1
-        bit -= 1
-        payload = payload[byte:]
-
-        if not bit_length.could_fit_in_bytes(payload):
-            raise ValueError(
-                "not enough bits for SPN - need {}, from {}.{} in payload[{}]".format(
-                    bit_length.max_len, byte, byte, hexlify(payload)
-                )
-            )
-
-        v = int.from_bytes(payload, byteorder="little")
-        v >>= bit
-        v &= mask(bit_length.max_len)
-
-        additional_bytes = math.ceil((bit + bit_length.max_len) / 8.0) - 1
-        last_byte_idx = byte + additional_bytes
-        return v, last_byte_idx
+        return _make_section(byte - 1, bit - 1, bit_length), None
 
     # multi byte section
     first, last = section.split("-")
-    f_byte, f_bit = byte_and_bit_from_num(first)
+    byte_and_bit_from_num(first)
     l_byte, l_bit = byte_and_bit_from_num(last)
 
     if l_bit != 1:
@@ -569,7 +947,221 @@ def extract_value_at_location(payload, location, bit_length):
 
     # last address starts on a byte boundary...so everything should be
     # contiguous???
-    return extract_value_at_location(payload, first, bit_length)
+    return _compile_sections(first, bit_length)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_location(location, bit_length):
+    """
+    Compile a location spec into an ExtractionPlan.
+
+    Locations that cannot be used to extract a numeric value (e.g. "a" or
+    "4 to N" for text SPNs) still compile, but raise the original parsing
+    error if a numeric extraction is attempted.
+    """
+    try:
+        section, extra = _compile_sections(location, bit_length)
+    except (ValueError, TypeError, AttributeError):
+        section, extra = None, None
+
+    try:
+        first_byte_idx = int(location.split()[0].split("-")[0]) - 1
+    except (ValueError, IndexError):
+        first_byte_idx = None
+
+    return ExtractionPlan(location, bit_length, section, extra, first_byte_idx)
+
+
+def as_extraction_plan(location, bit_length=None):
+    if isinstance(location, ExtractionPlan):
+        return location
+    return compile_location(location, bit_length)
+
+
+def extract_value_at_location(payload, location, bit_length):
+    """
+    Extract a "numeric" payload from the byte array at the provided location
+
+    The location can either be a location spec string, or an ExtractionPlan
+    already compiled from one.
+
+    Returns: (value, last_byte_idx)
+
+    where
+     - value: the "bit_length" at "location" from the payload, and
+     - last_byte_idx: is the index of the last byte that the value was in.
+    """
+    if isinstance(location, ExtractionPlan):
+        plan_bit_length = location.bit_length
+        if plan_bit_length is not bit_length and plan_bit_length != bit_length:
+            location = compile_location(location.location, bit_length)
+    else:
+        location = compile_location(location, bit_length)
+    return location.extract(payload)
+
+
+def is_simple_numeric_record(record, pgn):
+    """
+    Whether the record is a fixed length scalar or encoded SPN with a
+    compiled location, i.e. one that can be decoded without the generic loop.
+    """
+    spn, plan = record.spn, record.location
+    decoder = spn.value_decoder
+    return (
+        type(decoder) in (ScalarValue, EncodedValue)
+        and not pgn.is_repeatable(spn)
+        and isinstance(plan, ExtractionPlan)
+        and plan.section is not None
+        and plan.bit_length == decoder.bit_length
+        and not decoder.bit_length.variable
+    )
+
+
+def _raw_expression(plan):
+    sections = [plan.section]
+    if plan.extra is not None:
+        sections.append(plan.extra)
+
+    parts = []
+    for section in sections:
+        shift = section.byte_idx * 8 + section.bit_shift
+        part = "((v >> {}) & {})".format(shift, hex(section.mask))
+        if section.value_shift:
+            part = "({} << {})".format(part, section.value_shift)
+        parts.append(part)
+    return " + ".join(parts)
+
+
+def _scalar_source(decoder, const):
+    # The display values are left as callables, see display_value_of
+    lines = []
+    branch = "if"
+    thresholds = decoder.range_thresholds()
+    if thresholds is not None:
+        has_error_code = not decoder.bit_length.is_equivalent_to(8)
+        for message, thres in zip(RANGE_INDICATOR_NAMES, thresholds):
+            lines.append("{} raw >= {}:".format(branch, thres))
+            lines.append("    val = {!r}".format(message))
+            if has_error_code:
+                lines.append(
+                    "    disp = partial(range_indicator_display_value, {!r}, "
+                    "raw - {})".format(message, thres)
+                )
+            else:
+                lines.append("    disp = {!r}".format(message))
+            branch = "elif"
+        lines.append("else:")
+        indent = "    "
+    else:
+        indent = ""
+
+    body = ["val = raw"]
+    if decoder.scale:
+        body.append("val *= {}".format(const(decoder.scale)))
+    if decoder.offset:
+        body.append("val += {}".format(const(decoder.offset)))
+    body.append(
+        "disp = partial({}, val)".format(const(decoder.as_display_value))
+    )
+    for limit, op, word in (
+        (decoder.min, "<", "min"),
+        (decoder.max, ">", "max"),
+    ):
+        if not limit:
+            continue
+        body.append("if val {} {}:".format(op, const(limit)))
+        body.append(
+            "    disp = partial({}, {!r}, {}, val)".format(
+                const(decoder.clipped_display_value), word, const(limit)
+            )
+        )
+        body.append("    val = {}".format(const(limit)))
+
+    lines.extend(indent + line for line in body)
+    return lines
+
+
+def _encoded_source(decoder, const):
+    encodings = decoder.encodings
+    if isinstance(encodings, DenseEncodings):
+        # raw is masked to the bit length, so is always inside the table
+        lookup = "val = {}[raw]".format(const(encodings.table))
+    else:
+        lookup = "val = {}.get(raw)".format(const(encodings))
+    return [
+        lookup,
+        "disp = partial(encoded_display_value, val, raw)",
+    ]
+
+
+def build_fast_decoder(pgn, records=None):
+    """
+    Generate a specialised decoding function for the PGN (or for just some of
+    its records).
+
+    This is only possible for fixed length PGNs made up entirely of scalar and
+    encoded SPNs. The generated function converts the whole payload to a
+    single int and then shifts and masks out each SPN, giving the same
+    results as the generic PGN.decode loop.
+
+    Returns the function, or None if the PGN cannot be decoded this way. The
+    function itself returns None if the payload is too short, so that the
+    caller can fall back to the generic path (and its error reporting).
+    """
+    if records is None:
+        records = pgn.ordering_records
+    if pgn.length.variable or not records:
+        return None
+    if not all(is_simple_numeric_record(record, pgn) for record in records):
+        return None
+
+    namespace = {
+        "DecodedSPN": DecodedSPN,
+        "partial": functools.partial,
+        "encoded_display_value": encoded_display_value,
+        "range_indicator_display_value": range_indicator_display_value,
+    }
+
+    def const(value):
+        name = "c{}".format(len(namespace))
+        namespace[name] = value
+        return name
+
+    payload_len = 0
+    body = []
+    for record in records:
+        plan, spn = record.location, record.spn
+        for section in (plan.section, plan.extra):
+            if section is not None:
+                payload_len = max(
+                    payload_len, section.byte_idx + section.byte_span
+                )
+
+        body.append("# SPN {}".format(spn.id))
+        body.append("raw = {}".format(_raw_expression(plan)))
+        if isinstance(spn.value_decoder, ScalarValue):
+            body.extend(_scalar_source(spn.value_decoder, const))
+        else:
+            body.extend(_encoded_source(spn.value_decoder, const))
+        body.append(
+            "append(DecodedSPN({}, raw, val, disp))".format(const(spn))
+        )
+
+    name = "decode_pgn_{}".format(pgn.id)
+    source = "\n".join(
+        [
+            "def {}(value):".format(name),
+            "    if len(value) < {}:".format(payload_len),
+            "        return None",
+            '    v = int.from_bytes(value[:{}], "little")'.format(payload_len),
+            "    decoded = []",
+            "    append = decoded.append",
+        ]
+        + ["    " + line for line in body]
+        + ["    return decoded"]
+    )
+    exec(compile(source, "<decoda PGN {}>".format(pgn.id), "exec"), namespace)
+    return namespace[name]
 
 
 @attr.s(frozen=True)
@@ -582,18 +1174,79 @@ class PGN:
     ordering_records = attr.ib()
     repeatable_spns = attr.ib(factory=list)
     acronym = attr.ib(default=None)
+    # Generated on first decode, False if the PGN cannot use a fast decoder
+    _fast_decoder = attr.ib(default=None, init=False, eq=False, repr=False)
+    # frozenset of SPN ids -> the records and fast decoder (or False) for them
+    _projections: Dict[frozenset, Tuple[list, Any]] = attr.ib(
+        factory=dict, init=False, eq=False, repr=False
+    )
+
+    def __getstate__(self):
+        # The generated decoders cannot be pickled, they are rebuilt on use
+        state = self.__dict__.copy()
+        state["_fast_decoder"] = None
+        state["_projections"] = {}
+        return state
 
     def is_repeatable(self, spn):
         return spn.id in self.repeatable_spns
 
-    def decode(self, value):
+    def decode(self, value, spns=None):
+        """
+        Decode the payload into a list of DecodedSPNs.
+
+        If spns (a set of SPN ids, ideally a frozenset) is given, only those
+        SPNs are included, and where possible only those are decoded.
+        """
+        if spns is not None:
+            return self.decode_projection(value, spns)
+
+        fast_decoder = self._fast_decoder
+        if fast_decoder is None:
+            fast_decoder = build_fast_decoder(self) or False
+            object.__setattr__(self, "_fast_decoder", fast_decoder)
+        if fast_decoder:
+            decoded = fast_decoder(value)
+            if decoded is not None:
+                return decoded
+        return self.decode_generic(value)
+
+    def decode_projection(self, value, spns):
+        spns = frozenset(spns)
+        projection = self._projections.get(spns)
+        if projection is None:
+            records = [r for r in self.ordering_records if r.spn.id in spns]
+            fast_decoder = False
+            if records:
+                fast_decoder = build_fast_decoder(self, records) or False
+            projection = self._projections[spns] = (records, fast_decoder)
+
+        records, fast_decoder = projection
+        if not records:
+            return []
+        if fast_decoder:
+            decoded = fast_decoder(value)
+            if decoded is not None:
+                return decoded
+        return [d for d in self.decode(value) if d.spn.id in spns]
+
+    def decode_batch(self, payloads):
+        """
+        Decode many payloads of this PGN at once into columns of numpy arrays
+        (see decoda.batch.decode_batch, requires the "batch" extra).
+        """
+        from decoda.batch import decode_batch
+
+        return decode_batch(self, payloads)
+
+    def decode_generic(self, value):
         decoded = []
         pgn_is_variable = self.length.variable
         ended_in_byte_idx = -1
         repeatable_spn_idx = None
 
         for idx, record in enumerate(self.ordering_records):
-            start, spn = record.start, record.spn
+            start, spn = record.location, record.spn
 
             if self.is_repeatable(spn):
                 repeatable_spn_idx = idx
@@ -619,7 +1272,7 @@ class PGN:
             # Do the first set of repeatable SPNs
             start_idx = ended_in_byte_idx
             for record in repeatables:
-                start, spn = record.start, record.spn
+                start, spn = record.location, record.spn
                 result, ended_in_byte_idx = spn.decode(
                     value,
                     start,
@@ -637,7 +1290,7 @@ class PGN:
             while len(value) > end_idx + bytes_in_repeat:
                 value = value[bytes_in_repeat:]
                 for record in repeatables:
-                    start, spn = record.start, record.spn
+                    start, spn = record.location, record.spn
                     result, ended_in_byte_idx = spn.decode(
                         value,
                         start,
@@ -662,15 +1315,26 @@ class Address:
         if not -1 <= value <= 255:
             raise ValueError("address out of range")
 
+    @staticmethod
+    def from_num(num):
+        """
+        The shared instance for an address number (-1 is broadcast).
+        """
+        if not -1 <= num <= 255:
+            raise ValueError("address out of range")
+        return _ADDRESSES[num]
+
     @staticmethod
     def from_pf_and_ps(pf, ps):
         if pf >= 0xF0:
             return BroadcastAddress
 
-        return Address(ps)
+        return _ADDRESSES[ps]
 
 
 BroadcastAddress = Address(-1)
+# Indexed by address number, so that _ADDRESSES[-1] is the broadcast address
+_ADDRESSES = tuple(Address(num) for num in range(256)) + (BroadcastAddress,)
 
 
 @attr.s(frozen=True)
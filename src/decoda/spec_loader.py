@@ -1,11 +1,14 @@
 # Copyright Andrew Dodd
+import abc
 import importlib
 import json
 import math
 import os
+import pickle
+import struct
 from binascii import hexlify
 from numbers import Number
-from typing import Callable, Dict, Generic, List, Type, TypeVar
+from typing import Callable, Dict, Generic, List, Tuple, Type, TypeVar
 
 import attr
 
@@ -22,9 +25,11 @@ from decoda.main import (
     OrderingRecord,
     ScalarValue,
     TextValue,
+    compile_location,
 )
 
 T = TypeVar("T", covariant=True)
+R = TypeVar("R", bound="Repo")
 
 
 class Repo(Generic[T]):
@@ -37,21 +42,205 @@ class Repo(Generic[T]):
             int(r["id"]): from_dict(r, *args, **kwargs) for r in l
         }
 
+    @classmethod
+    def from_objects(cls: Type[R], item_cls, objects) -> R:
+        """
+        Make a Repo from already built objects (looked up by their id).
+        """
+        repo = cls.__new__(cls)
+        repo.__cls = item_cls
+        repo.__lookup = {int(obj.id): obj for obj in objects}
+        return repo
+
+    def get_by_id(self, id) -> T:
+        try:
+            return self.__lookup[id]
+        except KeyError:
+            raise UnknownReferenceError(
+                "{} not found for id: {}".format(self.__cls.__name__, id)
+            )
+
+
+class LazyRepo(Repo[T]):
+    """
+    A Repo that keeps the dicts, and only builds each object the first time
+    it is looked up (so references to other repos are also only resolved
+    then). Dicts that cannot be built are treated as not found, as they are
+    left out when loading eagerly.
+    """
+
+    def __init__(
+        self, cls: Type[T], from_dict: Callable[[Dict], T], l, *args, **kwargs
+    ):
+        self.__cls = cls
+        self.__from_dict = from_dict
+        self.__args = args
+        self.__kwargs = kwargs
+        self.__dicts: Dict[int, Dict] = {int(r["id"]): r for r in l}
+        self.__lookup: Dict[int, T] = {}
+
     def get_by_id(self, id) -> T:
         try:
             return self.__lookup[id]
         except KeyError:
+            pass
+
+        d = self.__dicts.get(id)
+        if d is None:
+            raise UnknownReferenceError(
+                "{} not found for id: {}".format(self.__cls.__name__, id)
+            )
+        try:
+            obj = self.__from_dict(d, *self.__args, **self.__kwargs)
+        except Exception as e:
+            del self.__dicts[id]
             raise UnknownReferenceError(
                 "{} not found for id: {}".format(self.__cls.__name__, id)
+            ) from e
+        self.__lookup[id] = obj
+        return obj
+
+
+def _index_key(text):
+    return text.casefold() if isinstance(text, str) and text else None
+
+
+def _add_to_index(index, key, item):
+    if key is not None:
+        index.setdefault(key, []).append(item)
+
+
+class BasePGNRepo(Repo[PGN], abc.ABC):
+    """
+    A Repo of PGNs that can also find the PGNs that carry an SPN, and the
+    PGNs with an acronym or name (ignoring case).
+    """
+
+    @abc.abstractmethod
+    def find_by_spn(self, spn_id) -> List[Tuple[PGN, OrderingRecord]]:
+        """
+        The (PGN, OrderingRecord) of each place the SPN is carried.
+        """
+
+    @abc.abstractmethod
+    def find_by_acronym(self, acronym) -> List[PGN]:
+        pass
+
+    @abc.abstractmethod
+    def find_by_name(self, name) -> List[PGN]:
+        pass
+
+
+class PGNRepo(BasePGNRepo):
+    """
+    A BasePGNRepo with indices built when the repo is made.
+    """
+
+    def __init__(
+        self,
+        cls: Type[PGN],
+        from_dict: Callable[[Dict], PGN],
+        l,
+        *args,
+        **kwargs,
+    ):
+        l = list(l)
+        super().__init__(cls, from_dict, l, *args, **kwargs)
+        self._index_pgns(
+            self.get_by_id(id) for id in dict.fromkeys(int(r["id"]) for r in l)
+        )
+
+    @classmethod
+    def from_objects(cls, item_cls: Type[PGN], objects) -> "PGNRepo":
+        objects = {int(obj.id): obj for obj in objects}
+        repo = super().from_objects(item_cls, objects.values())
+        repo._index_pgns(objects.values())
+        return repo
+
+    def _index_pgns(self, pgns):
+        # SPN id -> [(PGN, OrderingRecord)]
+        self._by_spn: Dict[int, List[Tuple[PGN, OrderingRecord]]] = {}
+        self._by_acronym: Dict[str, List[PGN]] = {}
+        self._by_name: Dict[str, List[PGN]] = {}
+        for pgn in pgns:
+            for record in pgn.ordering_records:
+                _add_to_index(self._by_spn, record.spn.id, (pgn, record))
+            _add_to_index(self._by_acronym, _index_key(pgn.acronym), pgn)
+            _add_to_index(self._by_name, _index_key(pgn.name), pgn)
+
+    def find_by_spn(self, spn_id) -> List[Tuple[PGN, OrderingRecord]]:
+        return list(self._by_spn.get(spn_id, ()))
+
+    def find_by_acronym(self, acronym) -> List[PGN]:
+        return list(self._by_acronym.get(_index_key(acronym), ()))
+
+    def find_by_name(self, name) -> List[PGN]:
+        return list(self._by_name.get(_index_key(name), ()))
+
+
+class LazyPGNRepo(LazyRepo[PGN], BasePGNRepo):
+    """
+    A LazyRepo that is a BasePGNRepo. The indices are built
+    from the dicts, and the PGNs that are found are built as they are
+    looked up (those that cannot be built are left out).
+    """
+
+    def __init__(
+        self,
+        cls: Type[PGN],
+        from_dict: Callable[[Dict], PGN],
+        l,
+        *args,
+        **kwargs,
+    ):
+        l = list(l)
+        super().__init__(cls, from_dict, l, *args, **kwargs)
+        # SPN id / acronym / name -> PGN ids
+        self._by_spn: Dict[int, List[int]] = {}
+        self._by_acronym: Dict[str, List[int]] = {}
+        self._by_name: Dict[str, List[int]] = {}
+        for d in {int(r["id"]): r for r in l}.values():
+            id = int(d["id"])
+            for spn_id in dict.fromkeys(
+                int(item["id"]) for item in d.get("spns", ()) if "id" in item
+            ):
+                _add_to_index(self._by_spn, spn_id, id)
+            _add_to_index(self._by_acronym, _index_key(d.get("acronym")), id)
+            _add_to_index(
+                self._by_name, _index_key(d.get("name", d.get("label"))), id
             )
 
+    def _pgns(self, ids):
+        for id in ids:
+            try:
+                yield self.get_by_id(id)
+            except UnknownReferenceError:
+                pass
+
+    def find_by_spn(self, spn_id) -> List[Tuple[PGN, OrderingRecord]]:
+        return [
+            (pgn, record)
+            for pgn in self._pgns(self._by_spn.get(spn_id, ()))
+            for record in pgn.ordering_records
+            if record.spn.id == spn_id
+        ]
+
+    def find_by_acronym(self, acronym) -> List[PGN]:
+        return list(self._pgns(self._by_acronym.get(_index_key(acronym), ())))
+
+    def find_by_name(self, name) -> List[PGN]:
+        return list(self._pgns(self._by_name.get(_index_key(name), ())))
+
 
 @attr.s(frozen=True)
 class J1939Spec:
     Manufacturers: Repo[Manufacturer] = attr.ib()
     SPNs: Repo[SPN] = attr.ib()
-    PGNs: Repo[PGN] = attr.ib()
+    PGNs: BasePGNRepo = attr.ib()
     IndustryGroups: Repo[IndustryGroup] = attr.ib()
+    # The (dict, exception) of each SPN / PGN that could not be loaded
+    spns_in_error: List = attr.ib(factory=list, eq=False, repr=False)
+    pgns_in_error: List = attr.ib(factory=list, eq=False, repr=False)
 
     def preferred_address_name(self, id, industry_group=0):
         if id == -1:
@@ -170,7 +359,9 @@ def build_ordering_records(spn_list, spn_ref):
         start_pos = item["start_pos"]
         if not isinstance(start_pos, str):
             raise ValueError("Hmm...start pos is not a string")
-        spns.append(OrderingRecord(start_pos, spn_ref.get_by_id(item["id"])))
+        spn = spn_ref.get_by_id(item["id"])
+        location = compile_location(start_pos, spn.value_decoder.bit_length)
+        spns.append(OrderingRecord(start_pos, spn, location))
     return sorted(spns)
 
 
@@ -218,41 +409,107 @@ def convert_addresses(d):
     return addresses
 
 
-def load_from_file(filename, warn_of_errors=True):
-    with open(filename) as f:
+# Compiled specs start with this, then the format version and the version of
+# decoda that compiled them, then the pickled J1939Spec
+COMPILED_SPEC_MAGIC = b"DECODA-SPEC\n"
+COMPILED_SPEC_FORMAT = 3
+
+
+def save_compiled_spec(spec, filename):
+    """
+    Save a loaded spec in the compiled (binary) format, which loads a few
+    times faster than the JSON spec (but is usually larger than it).
+
+    The spec objects are pickled, so loading one can run arbitrary code: only
+    load compiled specs you trust.
+    """
+    from decoda import __version__
+
+    version = __version__.encode()
+    with open(filename, "wb") as f:
+        f.write(COMPILED_SPEC_MAGIC)
+        f.write(struct.pack("<HH", COMPILED_SPEC_FORMAT, len(version)))
+        f.write(version)
+        pickle.dump(spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def compile_spec(json_filename, compiled_filename, warn_of_errors=False):
+    save_compiled_spec(
+        load_from_file(json_filename, warn_of_errors), compiled_filename
+    )
+
+
+def load_compiled_spec(filename):
+    """
+    Load a spec saved by save_compiled_spec.
+
+    The header is checked before anything is unpickled, but the spec objects
+    are still pickled, so loading one can run arbitrary code: only load
+    compiled specs you trust.
+    """
+    from decoda import __version__
+
+    with open(filename, "rb") as f:
+        if f.read(len(COMPILED_SPEC_MAGIC)) != COMPILED_SPEC_MAGIC:
+            raise ValueError("{} is not a compiled spec".format(filename))
+        header = f.read(4)
+        if len(header) != 4:
+            raise ValueError("{} is not a compiled spec".format(filename))
+        spec_format, version_len = struct.unpack("<HH", header)
+        version = f.read(version_len).decode()
+        if spec_format != COMPILED_SPEC_FORMAT or version != __version__:
+            raise ValueError(
+                "Compiled spec is from decoda {} (format {}), it needs to be "
+                "compiled again for decoda {}".format(
+                    version, spec_format, __version__
+                )
+            )
+        return pickle.load(f)
+
+
+def load_from_file(filename, warn_of_errors=False, lazy=False):
+    """
+    Load a JSON spec (compiled specs are loaded with load_compiled_spec).
+
+    The SPNs and PGNs that cannot be loaded are left out, and listed in the
+    spns_in_error and pgns_in_error of the spec (and printed, if
+    warn_of_errors is True).
+
+    If lazy is True, the SPNs and PGNs are only built when they are first
+    looked up (so errors are not known, or warned of, until then).
+    """
+    with open(filename, "rb") as f:
+        if f.read(len(COMPILED_SPEC_MAGIC)) == COMPILED_SPEC_MAGIC:
+            raise ValueError(
+                "{} is a compiled spec, load it with load_compiled_spec".format(
+                    filename
+                )
+            )
+        f.seek(0)
         spec = json.load(f)
+
+    if lazy:
+        spns = LazyRepo(SPN, spn_from_dict, spec["SPNs"])
+        pgns = LazyPGNRepo(PGN, pgn_from_dict, spec["PGNs"], spns)
+        return _spec_from_dict(spec, spns, pgns)
+
     spns_in_error = []
-    spn_specs = []
+    spn_objects = []
     for spn in spec["SPNs"]:
         try:
-            spn_from_dict(spn)
-            spn_specs.append(spn)
+            spn_objects.append(spn_from_dict(spn))
         except Exception as e:
             spns_in_error.append((spn, e))
-            pass
-    spns = Repo(SPN, spn_from_dict, spn_specs)
+    spns = Repo.from_objects(SPN, spn_objects)
 
     pgns_in_error = []
-    pgn_specs = []
+    pgn_objects = []
     for pgn in spec["PGNs"]:
         try:
-            pgn_from_dict(pgn, spns)
-            pgn_specs.append(pgn)
+            pgn_objects.append(pgn_from_dict(pgn, spns))
         except Exception as e:
             pgns_in_error.append((pgn, e))
-            pass
-
-    pgns = Repo(PGN, pgn_from_dict, pgn_specs, spns)
-    manufacturers = Repo(
-        Manufacturer, manufacturer_from_dict, spec["Manufacturers"]
-    )
-    preferred_addresses = convert_addresses(spec["SourceAddresses"])
-    industry_groups = Repo(
-        IndustryGroup,
-        industry_group_from_dict,
-        spec["IndustryGroups"],
-        preferred_addresses,
-    )
+    pgns = PGNRepo.from_objects(PGN, pgn_objects)
 
     if warn_of_errors:
         if spns_in_error:
@@ -266,7 +523,28 @@ def load_from_file(filename, warn_of_errors=True):
             )
             print(f"PGN IDs with errors: {pgn_ids}")
 
-    return J1939Spec(manufacturers, spns, pgns, industry_groups)
+    return _spec_from_dict(spec, spns, pgns, spns_in_error, pgns_in_error)
+
+
+def _spec_from_dict(spec, spns, pgns, spns_in_error=(), pgns_in_error=()):
+    manufacturers = Repo(
+        Manufacturer, manufacturer_from_dict, spec["Manufacturers"]
+    )
+    preferred_addresses = convert_addresses(spec["SourceAddresses"])
+    industry_groups = Repo(
+        IndustryGroup,
+        industry_group_from_dict,
+        spec["IndustryGroups"],
+        preferred_addresses,
+    )
+    return J1939Spec(
+        manufacturers,
+        spns,
+        pgns,
+        industry_groups,
+        list(spns_in_error),
+        list(pgns_in_error),
+    )
 
 
 # This is a rather ugly technique for now...just want to supply a lazy-loaded
@@ -1,7 +1,47 @@
 # Copyright Andrew Dodd
+import functools
+import mmap
+import tempfile
+from collections import deque
+from typing import Callable, Container, FrozenSet, Optional
+
 import attr
 
-from .main import Address
+from .exceptions import UnknownReferenceError
+from .main import PGN, Address
+
+TP_CM_PGN = 60416  # TP - Connection Management
+TP_DT_PGN = 60160  # TP - Data Transfer
+TRANSPORT_PGNS = (TP_CM_PGN, TP_DT_PGN)
+ETP_CM_PGN = 51456  # ETP - Connection Management
+ETP_DT_PGN = 50944  # ETP - Data Transfer
+EXTENDED_TRANSPORT_PGNS = (ETP_CM_PGN, ETP_DT_PGN)
+
+TP_CM_RTS = 16  # Request to Send
+TP_CM_CTS = 17  # Clear to Send
+TP_CM_BAM = 32  # Broadcast Announce Message
+ETP_CM_RTS = 20  # Request to Send
+ETP_CM_CTS = 21  # Clear to Send
+ETP_CM_DPO = 22  # Data Packet Offset
+
+# Stands in for the PGN of frames that Decoda drops without decoding
+_IGNORED = object()
+
+# The most CAN ids that Decoda remembers the PGN of (and that
+# parts_from_can_id caches the parts of)
+ROUTE_CACHE_SIZE = 4096
+
+# The largest messages that can be announced, in packets of 7 bytes
+TP_MAX_PACKETS = 255
+ETP_MAX_PACKETS = 0xFFFFFF
+
+# Reassembly buffers larger than this are spilled to a temporary file
+SPILL_THRESHOLD = 1 << 20
+
+# J1939-21 transport timeouts, in seconds
+TP_T1 = 0.75  # Between data packets
+TP_T2 = 1.25  # After a CTS, until the data arrives
+TP_T3 = 1.25  # After the RTS (or last data packet), until a CTS arrives
 
 
 def parts_from_pgn(pgn):
@@ -12,6 +52,7 @@ def parts_from_pgn(pgn):
     return edp, dp, pf, ps
 
 
+@functools.lru_cache(maxsize=ROUTE_CACHE_SIZE)
 def parts_from_can_id(can_id):
     sa = 0xFF & can_id
     pgn = 0x3FFFF & (can_id >> 8)
@@ -23,7 +64,17 @@ def parts_from_can_id(can_id):
         pgn &= 0xFF00
 
     priority = 0x7 & (can_id >> (8 + 18))
-    return priority, pgn, Address(sa), da
+    return priority, pgn, Address.from_num(sa), da
+
+
+def _optional_frozenset(ids):
+    return None if ids is None else frozenset(ids)
+
+
+def _address_set(addresses):
+    if addresses is None or isinstance(addresses, range):
+        return addresses
+    return frozenset(a.num if isinstance(a, Address) else a for a in addresses)
 
 
 @attr.s(frozen=True)
@@ -33,132 +84,529 @@ class Message:
     dst_address = attr.ib()
     pgn = attr.ib()
     decoded = attr.ib()
+    payload = attr.ib(default=None, repr=False)
+    timestamp = attr.ib(default=None)
+
+
+@attr.s(frozen=True, eq=False)
+class Subscription:
+    """
+    A callback for the messages of some PGNs, or of the PGNs that carry some
+    SPNs, from some source addresses (given as numbers, Addresses or a
+    range). None means any.
+
+    If spns is given, the messages passed to the callback only have those
+    SPNs decoded.
+    """
+
+    callback: Callable = attr.ib()
+    pgns: Optional[FrozenSet[int]] = attr.ib(
+        default=None, converter=_optional_frozenset
+    )
+    spns: Optional[FrozenSet[int]] = attr.ib(
+        default=None, converter=_optional_frozenset
+    )
+    source_addresses: Optional[Container[int]] = attr.ib(
+        default=None, converter=_address_set
+    )
+
+    def wants_pgn(self, pgn):
+        if self.pgns is not None and pgn.id not in self.pgns:
+            return False
+        return self.spns is None or any(
+            r.spn.id in self.spns for r in pgn.ordering_records
+        )
+
+    def wants_address(self, address):
+        return (
+            self.source_addresses is None
+            or address.num in self.source_addresses
+        )
+
+    def deliver(self, message):
+        if self.spns is not None:
+            message = attr.evolve(
+                message,
+                decoded=[d for d in message.decoded if d.spn.id in self.spns],
+            )
+        self.callback(message)
 
 
 class Decoda:
-    def __init__(self, spec, callback=None, error_handler=None):
+    """
+    Decodes frames with a spec, passing each decoded Message to the callback
+    and any errors to the error handler.
+
+    The PGN for each CAN id is looked up once, and remembered (including the
+    UnknownReferenceError for PGNs that are not in the spec, which is then
+    passed to the error handler for every frame with that id).
+
+    Payloads are decoded through the decode_cache or the delta_decoder, if one
+    is given (see decoda.cache).
+
+    If spns (a set of SPN ids) is given, only those SPNs are decoded, and
+    frames of PGNs that carry none of them are dropped without decoding
+    (except for the transport PGNs, so that a ConnectionManager still works).
+
+    Messages are also passed to any Subscriptions that want them (see
+    subscribe). If there are subscriptions and no callback (including when a
+    ConnectionManager only passes messages on to the default callback),
+    frames that no subscription wants are dropped without decoding. Subscriptions do not
+    apply to handle_frames.
+    """
+
+    def __init__(
+        self,
+        spec,
+        callback=None,
+        error_handler=None,
+        decode_cache=None,
+        delta_decoder=None,
+        spns=None,
+    ):
         self.__spec__ = spec
-        self._callback = callback if callback else lambda x: print(x)
+        self._callback = callback if callback else None
+        # Whether the callback wants every message (see set_callback)
+        self._catch_all = self._callback is not None
         self._handle_error = (
             error_handler if error_handler else lambda x: print(x)
         )
+        # PGN id -> PGN (or UnknownReferenceError, or _IGNORED)
+        self._pgns = {}
+        # CAN id -> (priority, SA, DA, PGN (or UnknownReferenceError))
+        self._routes = {}
+        self._subscriptions = []
+        # PGN id -> the Subscriptions that want that PGN
+        self._subscribers = {}
+        if decode_cache is not None and delta_decoder is not None:
+            raise ValueError("Use either a decode cache or a delta decoder")
+        self._spns = None if spns is None else frozenset(spns)
+        if self._spns is not None:
+            if decode_cache is not None or delta_decoder is not None:
+                raise ValueError(
+                    "spns cannot be used with a decode cache or delta decoder"
+                )
+            projection = self._spns
+            self._decode = lambda sa, pgn, payload: pgn.decode_projection(
+                payload, projection
+            )
+        elif delta_decoder is not None:
+            self._decode = delta_decoder.decode
+        else:
+            decode = (
+                PGN.decode if decode_cache is None else decode_cache.decode
+            )
+            self._decode = lambda sa, pgn, payload: decode(pgn, payload)
 
     def get_callback(self):
-        return self._callback
-
-    def set_callback(self, callback):
+        return self._callback if self._callback else self._print_message
+
+    def has_callback(self):
+        """
+        Whether a callback that wants every message has been set.
+        """
+        return self._catch_all
+
+    def set_callback(self, callback, catch_all=True):
+        """
+        Set the callback. If catch_all is False, the callback is not taken as
+        wanting every message, so frames are still dropped if there are
+        subscriptions and none of them want it (apart from the transport
+        PGNs, which the callback is always passed, for reassembly).
+        """
         if not callback:
             raise ValueError("Callback must be valid")
         self._callback = callback
+        self._catch_all = catch_all
+
+    def _print_message(self, message):
+        # The default callback, until anything subscribes
+        if not self._subscriptions:
+            print(message)
 
     def set_error_handler(self, error_handler):
         if not error_handler:
             raise ValueError("Error handler must be valid")
         self._handle_error = error_handler
 
+    def subscribe(self, callback, pgns=None, spns=None, source_addresses=None):
+        """
+        Pass the messages of the given PGN ids (or of the PGNs that carry
+        the given SPN ids) from the given source addresses to the callback,
+        returning the Subscription.
+        """
+        if not callback:
+            raise ValueError("Callback must be valid")
+        subscription = Subscription(callback, pgns, spns, source_addresses)
+        self._subscriptions.append(subscription)
+        self._subscribers.clear()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.remove(subscription)
+        self._subscribers.clear()
+
     def handle_frame(self, can_id, payload):
-        try:
-            priority, pgn_id, sa, da = parts_from_can_id(can_id)
-            pgn = self.__spec__.PGNs.get_by_id(pgn_id)
-            decoded = pgn.decode(payload)
+        route = self._routes.get(can_id)
+        if route is None:
+            route = self._route(can_id)
+        priority, sa, da, pgn = route
+        self._publish(priority, sa, da, pgn, payload)
+
+    def handle_frames(self, frames):
+        """
+        Decode an iterable of (timestamp, can_id, payload) frames, yielding
+        a Message for each one.
+
+        The messages are yielded rather than passed to the callback or the
+        subscriptions (so a ConnectionManager does not see them, and every
+        frame is decoded), errors are still passed to the error handler.
+        """
+        routes = self._routes
+        handle_error = self._handle_error
+        decode = self._decode
+        for timestamp, can_id, payload in frames:
+            route = routes.get(can_id)
+            if route is None:
+                route = self._route(can_id)
+            priority, sa, da, pgn = route
+            if pgn is _IGNORED:
+                continue
+            if isinstance(pgn, UnknownReferenceError):
+                handle_error(pgn)
+                continue
+            try:
+                decoded = decode(sa, pgn, payload)
+            except ValueError as e:
+                handle_error(e)
+                continue
+            yield Message(priority, sa, da, pgn, decoded, payload, timestamp)
 
-            self._callback(Message(priority, sa, da, pgn, decoded))
+    def handle_message(self, priority, sa, da, pgn_id, payload):
+        # Addresses can also be given as numbers
+        if isinstance(sa, int):
+            sa = Address.from_num(sa)
+        if isinstance(da, int):
+            da = Address.from_num(da)
+        pgn = self._pgns.get(pgn_id)
+        if pgn is None:
+            pgn = self._lookup_pgn(pgn_id)
+        self._publish(priority, sa, da, pgn, payload)
+
+    def _publish(self, priority, sa, da, pgn, payload):
+        if pgn is _IGNORED:
+            return
+        if isinstance(pgn, UnknownReferenceError):
+            self._handle_error(pgn)
+            return
+        callback = self._callback
+        subscribers = ()
+        if self._subscriptions:
+            subscribers = self._subscribers.get(pgn.id)
+            if subscribers is None:
+                subscribers = self._subscribers[pgn.id] = tuple(
+                    s for s in self._subscriptions if s.wants_pgn(pgn)
+                )
+            if subscribers:
+                subscribers = [s for s in subscribers if s.wants_address(sa)]
+            if (
+                not subscribers
+                and not self._catch_all
+                and (callback is None or pgn.id not in TRANSPORT_PGNS)
+            ):
+                return
+        elif callback is None:
+            callback = self._print_message
+        try:
+            decoded = self._decode(sa, pgn, payload)
+            message = Message(priority, sa, da, pgn, decoded, payload)
+            if callback is not None:
+                callback(message)
+            for subscription in subscribers:
+                subscription.deliver(message)
         except ValueError as e:
             self._handle_error(e)
 
-    def handle_message(self, priority, sa, da, pgn_id, payload):
+    def _lookup_pgn(self, pgn_id):
         try:
             pgn = self.__spec__.PGNs.get_by_id(pgn_id)
-            decoded = pgn.decode(payload)
-            self._callback(Message(priority, sa, da, pgn, decoded))
-        except ValueError as e:
-            self._handle_error(e)
+        except UnknownReferenceError as e:
+            pgn = e
+        else:
+            if (
+                self._spns is not None
+                and pgn_id not in TRANSPORT_PGNS
+                and not any(
+                    r.spn.id in self._spns for r in pgn.ordering_records
+                )
+            ):
+                pgn = _IGNORED
+        self._pgns[pgn_id] = pgn
+        return pgn
+
+    def _route(self, can_id):
+        priority, pgn_id, sa, da = parts_from_can_id(can_id)
+        pgn = self._pgns.get(pgn_id)
+        if pgn is None:
+            pgn = self._lookup_pgn(pgn_id)
+        route = (priority, sa, da, pgn)
+        if len(self._routes) < ROUTE_CACHE_SIZE:
+            self._routes[can_id] = route
+        return route
 
 
 class ConnectionManager:
-    def __init__(self, decoda, defragmenting_error_callback):
+    """
+    Reassembles messages sent with the transport protocol (TP.CM / TP.DT) and
+    the extended transport protocol (ETP.CM / ETP.DT).
+
+    Frames passed to handle_frame are checked for the transport PGNs straight
+    from the CAN id, and the control byte, sequence number and packet data
+    are read from the raw payload. If publish_transport_frames is False, the
+    TP.CM and TP.DT frames themselves are not decoded or published at all,
+    only the reassembled messages are. ETP frames are only published if the
+    spec defines their PGNs.
+
+    Each session reassembles into a buffer allocated from the announced
+    message size. Buffers larger than spill_threshold bytes (only possible
+    with ETP) are memory mapped temporary files, so that large transfers are
+    held by the page cache rather than the process. Sessions announcing more
+    packets than the protocol allows, or more bytes than their packets hold,
+    are refused and reported as "invalid message size".
+
+    If frames are given a timestamp (in seconds), sessions that are not
+    progressed within the J1939-21 T1/T2/T3 timeouts are dropped and reported
+    to the defragmenting error callback as "defragmentation timed out".
+    """
+
+    def __init__(
+        self,
+        decoda,
+        defragmenting_error_callback,
+        publish_transport_frames=True,
+        spill_threshold=SPILL_THRESHOLD,
+    ):
         self._active_defrags = {}
         self._decoda = decoda
         self._callback = decoda.get_callback()
         self._handle_error = defragmenting_error_callback
-        decoda.set_callback(self.handle_message)
+        self._publish_transport_frames = publish_transport_frames
+        self._publish_extended_frames = (
+            publish_transport_frames
+            and self._spec_has(ETP_CM_PGN)
+            and self._spec_has(ETP_DT_PGN)
+        )
+        self._spill_threshold = spill_threshold
+        self._now = None
+        # One queue of (deadline, key, state) per timeout, so each queue
+        # stays in deadline order as long as the timestamps do
+        self._deadlines = {
+            timeout: deque() for timeout in (TP_T1, TP_T2, TP_T3)
+        }
+        # Only taken as wanting every message if the callback it passes them
+        # on to does
+        decoda.set_callback(
+            self.handle_message, catch_all=decoda.has_callback()
+        )
+
+    def handle_frame(self, can_id, payload, timestamp=None):
+        if timestamp is not None:
+            self.expire(timestamp)
+
+        priority, pgn_id, sa, da = parts_from_can_id(can_id)
+        if pgn_id in EXTENDED_TRANSPORT_PGNS:
+            if self._publish_extended_frames:
+                self._decoda.handle_message(priority, sa, da, pgn_id, payload)
+            self._handle_transport(priority, sa, da, pgn_id, payload)
+        elif pgn_id in TRANSPORT_PGNS and not self._publish_transport_frames:
+            self._handle_transport(priority, sa, da, pgn_id, payload)
+        else:
+            self._decoda.handle_message(priority, sa, da, pgn_id, payload)
 
     def handle_message(self, message):
         # First publish the message outwards
         self._callback(message)
 
-        try:
-            # Next, attempt to look for reassembly opportunities
-            if message.pgn.id == 60416:  # TP - Connection Management
-                control_spn = next(
-                    value for value in message.decoded if value.id == 2556
-                )
-
-                if control_spn.value == "Clear to Send":
-                    self._start_new_defragmenting(message)
-                if control_spn.value == "Broadcast Announce Message":
-                    self._start_new_defragmenting(message)
-
-            if message.pgn.id == 60160:  # TP - Data Transfer
-                self._handle_fragment(message)
+        # Next, attempt to look for reassembly opportunities
+        if message.pgn.id in TRANSPORT_PGNS and message.payload is not None:
+            self._handle_transport(
+                message.priority,
+                message.src_address,
+                message.dst_address,
+                message.pgn.id,
+                message.payload,
+                message,
+            )
 
-        except Exception as e:
-            print(e)
-            raise
+    def expire(self, timestamp):
+        """
+        Drop the sessions whose timeout has passed at the given timestamp.
+        """
+        self._now = timestamp
+        for queue in self._deadlines.values():
+            while queue and queue[0][0] < timestamp:
+                deadline, key, state = queue.popleft()
+                if (
+                    state["deadline"] == deadline
+                    and self._active_defrags.get(key) is state
+                ):
+                    del self._active_defrags[key]
+                    self._handle_error("defragmentation timed out", state)
+
+    def _set_deadline(self, key, state, timeout):
+        if self._now is None:
+            return
+        deadline = self._now + timeout
+        state["deadline"] = deadline
+        self._deadlines[timeout].append((deadline, key, state))
+
+    def _handle_transport(self, priority, sa, da, pgn_id, payload, msg=None):
+        if pgn_id in (TP_CM_PGN, ETP_CM_PGN):
+            if len(payload) >= 8:
+                self._handle_control(priority, sa, da, pgn_id, payload)
+        elif payload:
+            cm_pgn = TP_CM_PGN if pgn_id == TP_DT_PGN else ETP_CM_PGN
+            self._handle_fragment(priority, sa, da, cm_pgn, payload, msg)
+
+    def _handle_control(self, priority, sa, da, cm_pgn, payload):
+        control = payload[0]
+        pgn = int.from_bytes(payload[5:8], "little")
+        if control in (TP_CM_RTS, TP_CM_BAM):
+            size = int.from_bytes(payload[1:3], "little")
+            self._start_new_defragmenting(
+                priority, sa, da, cm_pgn, pgn, size, payload[3], TP_MAX_PACKETS
+            )
+        elif control == ETP_CM_RTS:
+            size = int.from_bytes(payload[1:5], "little")
+            self._start_new_defragmenting(
+                priority,
+                sa,
+                da,
+                cm_pgn,
+                pgn,
+                size,
+                (size + 6) // 7,
+                ETP_MAX_PACKETS,
+            )
+        elif control in (TP_CM_CTS, ETP_CM_CTS):
+            # The receiver tells the sender (i.e. the other direction)
+            # which packet to send next
+            key = (da, sa, cm_pgn)
+            pair_state = self._active_defrags.get(key)
+            if pair_state is not None:
+                if control == TP_CM_CTS:
+                    next_packet_number = payload[2]
+                else:
+                    next_packet_number = int.from_bytes(payload[2:5], "little")
+                pair_state["next_packet_number"] = next_packet_number
+                self._set_deadline(key, pair_state, TP_T2)
+        elif control == ETP_CM_DPO:
+            # The sender says which packet the following sequence numbers
+            # count from
+            key = (sa, da, cm_pgn)
+            pair_state = self._active_defrags.get(key)
+            if pair_state is not None:
+                pair_state["offset"] = int.from_bytes(payload[2:5], "little")
+                self._set_deadline(key, pair_state, TP_T1)
+
+    def _start_new_defragmenting(
+        self, priority, sa, da, cm_pgn, pgn, size, packet_count, max_packets
+    ):
+        if packet_count > max_packets or size > packet_count * 7:
+            # Refused, rather than allocating whatever size was announced
+            self._handle_error(
+                "invalid message size",
+                {
+                    "pgn": pgn,
+                    "size": size,
+                    "packet_count": packet_count,
+                    "priority": priority,
+                    "src_address": sa,
+                    "dst_address": da,
+                },
+            )
+            return
 
-    def _start_new_defragmenting(self, message):
-        to_from_pair = (message.src_address, message.dst_address)
-        if to_from_pair in self._active_defrags:
-            progress = self._active_defrags[to_from_pair]
+        key = (sa, da, cm_pgn)
+        if key in self._active_defrags:
+            progress = self._active_defrags[key]
             self._handle_error("incomplete defragmentation", progress)
 
-        packet_count = next(
-            value for value in message.decoded if value.id == 2561
-        ).value
-        next_packet_number = next(
-            value for value in message.decoded if value.id == 2562
-        ).value
-        pgn = next(
-            value for value in message.decoded if value.id == 2563
-        ).value
-        self._active_defrags[to_from_pair] = {
+        self._active_defrags[key] = state = {
             "pgn": pgn,
+            "size": size,
             "packet_count": packet_count,
-            "next_packet_number": next_packet_number,
-            "fragments": [],
-            "original_message": message,
+            "next_packet_number": 1,
+            "offset": 0,
+            "data": self._allocate(max(size, packet_count * 7)),
+            "priority": priority,
+            "src_address": sa,
+            "dst_address": da,
+            "deadline": None,
         }
+        self._set_deadline(key, state, TP_T1 if da.num == 0xFF else TP_T3)
+
+    def _allocate(self, size):
+        if size <= self._spill_threshold:
+            return bytearray(size)
+        with tempfile.TemporaryFile() as spill_file:
+            spill_file.truncate(size)
+            return mmap.mmap(spill_file.fileno(), size)
+
+    def _handle_fragment(self, priority, sa, da, cm_pgn, payload, message):
+        key = (sa, da, cm_pgn)
+        pair_state = self._active_defrags.get(key)
+        if pair_state is None:
+            self._handle_error(
+                "fragment received without control",
+                message or self._message(priority, sa, da, cm_pgn, payload),
+            )
+            return
 
-    def _handle_fragment(self, message):
-        to_from_pair = (message.src_address, message.dst_address)
-        if to_from_pair not in self._active_defrags:
-            self._handle_error("fragment received without control", message)
+        packet_number = pair_state["offset"] + payload[0]
+        if (
+            packet_number != pair_state["next_packet_number"]
+            or packet_number > pair_state["packet_count"]
+        ):
+            self._handle_error(
+                "fragment received out of order",
+                message or self._message(priority, sa, da, cm_pgn, payload),
+            )
             return
 
-        pair_state = self._active_defrags[to_from_pair]
-        seq_no = next(
-            value for value in message.decoded if value.id == 2572
-        ).value
+        pair_state["next_packet_number"] = packet_number + 1
+        offset = (packet_number - 1) * 7
+        fragment = payload[1:8]
+        pair_state["data"][offset : offset + len(fragment)] = fragment
 
-        if seq_no != pair_state["next_packet_number"]:
-            self._handle_error("fragment received out of order", message)
+        if packet_number < pair_state["packet_count"]:
+            self._set_deadline(key, pair_state, TP_T1)
             return
 
-        pair_state["next_packet_number"] = seq_no + 1
-        fragment = next(
-            value for value in message.decoded if value.id == 2573
-        ).value
-        pair_state["fragments"].append(fragment)
-
-        if pair_state["next_packet_number"] > pair_state["packet_count"]:
-            reassembled = bytes()
-            for fragment in pair_state["fragments"]:
-                reassembled += fragment
-            original_msg = pair_state["original_message"]
-            priority = original_msg.priority
-            sa = original_msg.src_address
-            da = original_msg.dst_address
-            self._decoda.handle_message(
-                priority, sa, da, pair_state["pgn"], reassembled
-            )
-            del self._active_defrags[to_from_pair]
+        del self._active_defrags[key]
+        data = memoryview(pair_state["data"])[: pair_state["size"]]
+        if isinstance(pair_state["data"], bytearray):
+            data = bytes(data)
+        self._decoda.handle_message(
+            pair_state["priority"],
+            pair_state["src_address"],
+            pair_state["dst_address"],
+            pair_state["pgn"],
+            data,
+        )
+
+    def _spec_has(self, pgn_id):
+        try:
+            self._decoda.__spec__.PGNs.get_by_id(pgn_id)
+            return True
+        except UnknownReferenceError:
+            return False
+
+    def _message(self, priority, sa, da, cm_pgn, payload):
+        # Only needed when reporting an error for an undecoded data frame,
+        # which is left undecoded if the spec does not define its PGN
+        pgn_id = TP_DT_PGN if cm_pgn == TP_CM_PGN else ETP_DT_PGN
+        if not self._spec_has(pgn_id):
+            return Message(priority, sa, da, None, None, payload)
+        pgn = self._decoda.__spec__.PGNs.get_by_id(pgn_id)
+        return Message(priority, sa, da, pgn, pgn.decode(payload), payload)
@@ -3,8 +3,57 @@ from typing import Dict
 
 import pytest
 
-from decoda.main import PGN
-from decoda.spec_loader import spec_provider
+from decoda.main import PGN, SPN
+from decoda.spec_loader import (
+    Repo,
+    pgn_from_dict,
+    spec_provider,
+    spn_from_dict,
+)
+
+SYNTHETIC_SPNS = [
+    {
+        "id": 1,
+        "name": "Speed",
+        "bit_length": 16,
+        "resolution": 0.125,
+        "units": "km/h",
+    },
+    {
+        "id": 2,
+        "name": "Percent",
+        "bit_length": 8,
+        "data_range": {"min": 5, "max": 100},
+        "units": "%",
+    },
+    {
+        "id": 3,
+        "name": "Switch",
+        "bit_length": 2,
+        "encodings": {"0": "Off", "1": "On"},
+    },
+    {"id": 4, "name": "Split", "bit_length": 11, "offset": -10},
+    {"id": 5, "name": "Text", "bit_length": 16, "units": "ASCII"},
+    {
+        "id": 6,
+        "name": "Name",
+        "bit_length": 200,
+        "units": "ASCII",
+        "variable": True,
+        "delimiter": "*",
+    },
+]
+
+# Speed, Percent, Switch and Split packed into one 8 byte PGN
+SYNTHETIC_LAYOUT = [(1, "1-2"), (2, "3"), (3, "4.1"), (4, "5, 6.6")]
+
+SYNTHETIC_PAYLOADS = [
+    bytes(8),
+    b"\xff" * 8,
+    b"\xfe\xfe\xfb\xff\x00\x01\x02\x03",
+    b"\x10\x27\x01\x65\xfd\x07\x55\xaa",
+    b"\x00\xfc\x64\x02\x12\x34\x56\x78",
+]
 
 
 @pytest.fixture(scope="session")
@@ -15,6 +64,33 @@ def spec():
         pytest.skip("Unable to find a spec file")
 
 
+@pytest.fixture()
+def synthetic_spns() -> Repo[SPN]:
+    return Repo(SPN, spn_from_dict, SYNTHETIC_SPNS)
+
+
+@pytest.fixture()
+def make_pgn(synthetic_spns):
+    """Build a PGN over the synthetic SPNs from (spn id, start_pos) pairs."""
+
+    def make(positions, id=1, label="Test", length=8) -> PGN:
+        return pgn_from_dict(
+            {
+                "id": id,
+                "label": label,
+                "description": "",
+                "length": length,
+                "spns": [
+                    {"id": spn_id, "start_pos": start_pos}
+                    for spn_id, start_pos in positions
+                ],
+            },
+            synthetic_spns,
+        )
+
+    return make
+
+
 @pytest.fixture()
 def pgn_0(spec) -> PGN:
     return spec.PGNs.get_by_id(0)
@@ -0,0 +1,70 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from decoda import *
+from decoda.aio import AsyncDecoda
+
+
+async def frame_source(count, read):
+    for i in range(count):
+        read.append(i)
+        yield float(i), 0x0C000000 | (i & 0xFF), bytes(8)
+
+
+def test_it_streams_decoded_messages(spec: J1939Spec):
+    async def decode_all():
+        sut = AsyncDecoda(spec)
+        return [m async for m in sut.decode(frame_source(5, []))]
+
+    messages = asyncio.run(decode_all())
+
+    assert [(m.timestamp, m.pgn.id) for m in messages] == [
+        (float(i), 0) for i in range(5)
+    ]
+    assert messages[0].decoded == spec.PGNs.get_by_id(0).decode(bytes(8))
+
+
+def test_it_reassembles_transport_messages(spec: J1939Spec):
+    async def frames():
+        yield 1.0, 0x1CECFF25, bytes([32, 14, 0, 2, 0xFF, 0xCA, 0xFE, 0])
+        yield 1.1, 0x1CEBFF25, bytes([1]) + bytes(range(1, 8))
+        yield 1.2, 0x1CEBFF25, bytes([2]) + bytes(range(8, 15))
+
+    async def decode_all():
+        sut = AsyncDecoda(spec, publish_transport_frames=False)
+        return [m async for m in sut.decode(frames())]
+
+    messages = asyncio.run(decode_all())
+
+    assert [(m.timestamp, m.pgn.id) for m in messages] == [(1.2, 65226)]
+
+
+def test_it_stops_reading_frames_while_the_queue_is_full(spec: J1939Spec):
+    read: List[int] = []
+
+    async def decode_some():
+        sut = AsyncDecoda(spec, max_queue_size=2)
+        stream = sut.decode(frame_source(100, read))
+        await stream.__anext__()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        read_while_blocked = len(read)
+        await stream.aclose()
+        return read_while_blocked
+
+    assert asyncio.run(decode_some()) <= 4
+
+
+def test_it_raises_errors_from_the_frame_source(spec: J1939Spec):
+    async def frames():
+        yield 0.0, 0x0C000000, bytes(8)
+        raise OSError("bus off")
+
+    async def decode_all():
+        sut = AsyncDecoda(spec)
+        return [m async for m in sut.decode(frames())]
+
+    with pytest.raises(OSError):
+        asyncio.run(decode_all())
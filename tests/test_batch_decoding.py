@@ -0,0 +1,90 @@
+import math
+
+import pytest
+
+from decoda import *
+
+np = pytest.importorskip("numpy")
+
+from decoda.batch import BatchStatus  # noqa: E402
+
+from .conftest import SYNTHETIC_LAYOUT, SYNTHETIC_PAYLOADS  # noqa: E402
+
+
+@pytest.fixture()
+def pgn(make_pgn):
+    return make_pgn(SYNTHETIC_LAYOUT)
+
+
+def test_it_decodes_the_same_as_the_single_payload_decoder(pgn):
+    columns = pgn.decode_batch(SYNTHETIC_PAYLOADS)
+
+    for row, payload in enumerate(SYNTHETIC_PAYLOADS):
+        for decoded in pgn.decode(payload):
+            column = columns[decoded.id]
+            assert column.raw[row] == decoded.raw
+            if isinstance(decoded.value, str) and column.status[row] in (
+                BatchStatus.NOT_AVAILABLE,
+                BatchStatus.ERROR_INDICATOR,
+                BatchStatus.PARAMETER_SPECIFIC,
+            ):
+                assert math.isnan(column.value[row])
+            else:
+                assert column.value[row] == decoded.value
+
+
+def test_it_accepts_a_uint8_array(pgn):
+    arr = np.frombuffer(b"".join(SYNTHETIC_PAYLOADS), dtype=np.uint8).reshape(
+        -1, 8
+    )
+    columns = pgn.decode_batch(arr)
+    assert columns[1].raw[3] == 10000
+    assert columns[1].value[3] == 1250.0
+    assert columns[3].value[3] == "On"
+
+
+def test_it_reports_statuses(pgn):
+    columns = pgn.decode_batch(SYNTHETIC_PAYLOADS)
+    assert list(columns[1].status) == [
+        BatchStatus.VALID,
+        BatchStatus.NOT_AVAILABLE,
+        BatchStatus.ERROR_INDICATOR,
+        BatchStatus.VALID,
+        BatchStatus.PARAMETER_SPECIFIC,
+    ]
+    assert list(columns[2].status) == [
+        BatchStatus.CLIPPED_TO_MIN,
+        BatchStatus.NOT_AVAILABLE,
+        BatchStatus.PARAMETER_SPECIFIC,
+        BatchStatus.CLIPPED_TO_MIN,
+        BatchStatus.VALID,
+    ]
+    assert list(columns[3].status) == [
+        BatchStatus.VALID,
+        BatchStatus.NO_ENCODING,
+        BatchStatus.NO_ENCODING,
+        BatchStatus.VALID,
+        BatchStatus.NO_ENCODING,
+    ]
+
+
+def test_it_rejects_payloads_of_different_lengths(pgn):
+    with pytest.raises(ValueError) as e:
+        pgn.decode_batch([bytes(8), bytes(7)])
+    assert str(e.value) == "payloads must all be the same length"
+
+
+def test_it_rejects_short_payloads(pgn):
+    with pytest.raises(ValueError) as e:
+        pgn.decode_batch([bytes(2)])
+    assert str(e.value) == "not enough bytes for SPN 2 - need 3, have 2"
+
+
+def test_it_decodes_no_payloads_into_empty_columns(pgn):
+    columns = pgn.decode_batch([])
+
+    assert columns
+    for column in columns.values():
+        assert column.raw.shape == (0,)
+        assert column.value.shape == (0,)
+        assert column.status.shape == (0,)
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from decoda import *
+from decoda.cache import (
+    DECODED_SPN_SIZE,
+    ENTRY_SIZE,
+    CacheStats,
+    DecodeCache,
+    DeltaDecoder,
+)
+
+
+def test_it_returns_cached_results(pgn_0):
+    sut = DecodeCache()
+
+    first = sut.decode(pgn_0, bytes(range(8)))
+    second = sut.decode(pgn_0, bytes(range(8)))
+    sut.decode(pgn_0, bytes(8))
+
+    assert first == pgn_0.decode(bytes(range(8)))
+    assert second == first
+    assert second is not first
+    assert second[0] is first[0]
+    assert sut.stats(0) == CacheStats(hits=1, misses=2, evictions=0)
+    assert len(sut) == 2
+
+
+def test_it_evicts_the_least_recently_used_entries(pgn_0):
+    entry_size = (
+        ENTRY_SIZE + 8 + DECODED_SPN_SIZE * len(pgn_0.decode(bytes(8)))
+    )
+    sut = DecodeCache(max_bytes=2 * entry_size)
+
+    sut.decode(pgn_0, bytes([1] * 8))
+    sut.decode(pgn_0, bytes([2] * 8))
+    sut.decode(pgn_0, bytes([1] * 8))
+    sut.decode(pgn_0, bytes([3] * 8))
+    sut.decode(pgn_0, bytes([1] * 8))
+    sut.decode(pgn_0, bytes([2] * 8))
+
+    assert sut.stats() == CacheStats(hits=2, misses=4, evictions=2)
+    assert sut.size_bytes <= sut.max_bytes
+
+
+def test_it_only_caches_the_chosen_pgns(pgn_0):
+    sut = DecodeCache(pgns=[61444])
+
+    sut.decode(pgn_0, bytes(8))
+    sut.decode(pgn_0, bytes(8))
+
+    assert sut.stats() == CacheStats()
+    assert len(sut) == 0
+
+
+def test_decoda_can_use_a_cache(spec):
+    messages = []
+    cache = DecodeCache()
+    decoda = Decoda(spec, messages.append, decode_cache=cache)
+
+    for _ in range(5):
+        decoda.handle_frame(0x0C000000, bytes(8))
+    list(decoda.handle_frames([(0.0, 0x0C000000, bytes(8))]))
+
+    assert cache.stats(0) == CacheStats(hits=5, misses=1, evictions=0)
+    assert all(m.decoded == messages[0].decoded for m in messages)
+
+
+def test_delta_decoding_matches_full_decoding(pgn_0):
+    rng = random.Random(1939)
+    sut = DeltaDecoder()
+    payload = bytearray(8)
+    for _ in range(200):
+        payload[rng.randrange(8)] = rng.randrange(256)
+        expected = pgn_0.decode(bytes(payload))
+        assert sut.decode(Address(1), pgn_0, payload) == expected
+
+
+def test_delta_decoding_reuses_unchanged_spns(pgn_0):
+    sut = DeltaDecoder()
+    first = sut.decode(Address(1), pgn_0, bytes(8))
+    second = sut.decode(Address(1), pgn_0, bytes(7) + b"\x01")
+    other_source = sut.decode(Address(2), pgn_0, bytes(7) + b"\x01")
+
+    changed = [
+        idx for idx, (a, b) in enumerate(zip(first, second)) if a is not b
+    ]
+    assert changed and len(changed) < len(first)
+    assert all(first[idx].raw != second[idx].raw for idx in changed)
+    assert all(a is not b for a, b in zip(second, other_source))
+
+
+def test_decoda_can_use_a_delta_decoder(spec):
+    messages = []
+    decoda = Decoda(spec, messages.append, delta_decoder=DeltaDecoder())
+    decoda.handle_frame(0x0C000000, bytes(8))
+    decoda.handle_frame(0x0C000000, bytes(7) + b"\x01")
+
+    assert messages[1].decoded == spec.PGNs.get_by_id(0).decode(
+        bytes(7) + b"\x01"
+    )
+    with pytest.raises(ValueError):
+        Decoda(spec, decode_cache=DecodeCache(), delta_decoder=DeltaDecoder())
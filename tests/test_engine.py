@@ -0,0 +1,87 @@
+import pytest
+
+from decoda import *
+from decoda.engine import ShardedDecoda
+
+
+def frames_from(source_addresses):
+    timestamp = 0.0
+    for sa in source_addresses:
+        timestamp += 0.01
+        yield timestamp, 0x0C000000 | sa, bytes([sa] * 8)
+
+
+def test_it_decodes_in_timestamp_order(spec: J1939Spec):
+    frames = list(frames_from([1, 2, 3, 4, 5, 6, 1, 1, 2, 3]))
+    decoda = Decoda(spec)
+    expected = list(decoda.handle_frames(frames))
+
+    with ShardedDecoda(processes=3, chunk_size=4) as sut:
+        actual = list(sut.handle_frames(frames))
+
+    def summary(messages):
+        return [
+            (m.timestamp, m.src_address, m.dst_address, m.pgn, m.decoded)
+            for m in messages
+        ]
+
+    assert summary(actual) == summary(expected)
+
+
+def test_it_reassembles_within_a_shard(spec: J1939Spec):
+    defrag_errors = []
+    bam = bytes([32, 14, 0, 2, 0xFF, 0xCA, 0xFE, 0])
+    frames = [
+        (1.0, 0x1CECFF25, bam),
+        (1.1, 0x0C000001, bytes(8)),
+        (1.2, 0x1CEBFF25, bytes([1]) + bytes(range(1, 8))),
+        (1.3, 0x1CEBFF25, bytes([2]) + bytes(range(8, 15))),
+        (1.4, 0x1CEBFF26, bytes([1]) + bytes(7)),
+    ]
+
+    with ShardedDecoda(
+        processes=2,
+        defragmenting_error_callback=lambda *args: defrag_errors.append(args),
+        publish_transport_frames=False,
+    ) as sut:
+        messages = list(sut.handle_frames(frames))
+
+    assert [(m.timestamp, m.pgn.id) for m in messages] == [
+        (1.1, 0),
+        (1.3, 65226),
+    ]
+    assert messages[1].decoded == spec.PGNs.get_by_id(65226).decode(
+        bytes(range(1, 15))
+    )
+    assert [(reason, info.src_address) for reason, info in defrag_errors] == [
+        ("fragment received without control", Address(0x26))
+    ]
+
+
+def test_it_formats_the_display_values_in_the_parent(spec: J1939Spec):
+    payloads = [bytes(8), bytes(range(8)), bytes([0xFA] * 8)]
+    payloads += [bytes([0xFB] * 8), bytes([0xFE] * 8), bytes([0xFF] * 8)]
+    frames = [(float(i), 0x0C000001, p) for i, p in enumerate(payloads)]
+    expected = list(Decoda(spec).handle_frames(frames))
+
+    with ShardedDecoda(processes=1) as sut:
+        actual = list(sut.handle_frames(frames))
+
+    assert [[d.display_value for d in m.decoded] for m in actual] == [
+        [d.display_value for d in m.decoded] for m in expected
+    ]
+
+
+def test_it_does_not_send_display_values_between_processes(spec: J1939Spec):
+    from decoda.engine import _pack_message
+
+    def not_formatted():
+        raise AssertionError("display value was formatted")
+
+    spn = spec.SPNs.get_by_id(2556)
+    message = Message(
+        6, Address(1), Address(2), spec.PGNs.get_by_id(0), [], bytes(8)
+    )
+    message.decoded.append(DecodedSPN(spn, 1, 1, not_formatted))
+
+    assert _pack_message(message)[-1] == ((2556, 1, 1),)
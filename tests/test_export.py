@@ -0,0 +1,129 @@
+import math
+
+import pytest
+
+from decoda import *
+
+pa = pytest.importorskip("pyarrow")
+
+import pyarrow.parquet as pq  # noqa: E402
+
+from decoda.batch import BatchStatus  # noqa: E402
+from decoda.export import ColumnarExporter  # noqa: E402
+
+
+@pytest.fixture()
+def spec(synthetic_spns, make_pgn):
+    pgns = Repo.from_objects(
+        PGN,
+        [
+            make_pgn([(1, "2-3"), (3, "1.1")], id=65265, label="Fixed"),
+            make_pgn(
+                [(6, "1")], id=65260, label="Variable", length="Variable"
+            ),
+        ],
+    )
+    return J1939Spec(None, synthetic_spns, pgns, None)
+
+
+def frames():
+    yield 1.0, 0x18FEF100, b"\x01\x00\x01\xff\xff\xff\xff\xff"
+    yield 1.5, 0x18FEEC01, b"hello*"
+    yield 2.0, 0x18FEF102, b"\x00\xff\xff\xff\xff\xff\xff\xff"
+    yield 3.0, 0x18FEF100, b"\x02\x40\x00\xff\xff\xff\xff\xff"
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_it_writes_a_file_per_pgn(spec, tmp_path, file_format):
+    decoda = Decoda(spec)
+    with ColumnarExporter(
+        decoda, str(tmp_path), file_format, row_group_size=2
+    ) as exporter:
+        for timestamp, can_id, payload in frames():
+            exporter.handle_frame(timestamp, can_id, payload)
+
+    def read(pgn_id):
+        path = str(tmp_path / "pgn_{}.{}".format(pgn_id, file_format))
+        if file_format == "parquet":
+            return pq.read_table(path).to_pydict()
+        return pa.ipc.open_file(path).read_all().to_pydict()
+
+    fixed = read(65265)
+    assert fixed["timestamp"] == [1.0, 2.0, 3.0]
+    assert fixed["source_address"] == [0, 2, 0]
+    assert fixed["1"][0] == 32.0
+    assert math.isnan(fixed["1"][1])
+    assert fixed["1_status"] == [0, 1, 0]
+    assert fixed["3"] == ["On", "Off", None]
+
+    variable = read(65260)
+    assert variable["timestamp"] == [1.5]
+    assert variable["source_address"] == [1]
+    assert variable["6"] == ["hello"]
+
+
+def test_it_writes_bounded_row_groups(spec, tmp_path):
+    decoda = Decoda(spec)
+    with ColumnarExporter(decoda, str(tmp_path), row_group_size=2) as exporter:
+        for timestamp, can_id, payload in frames():
+            exporter.handle_frame(timestamp, can_id, payload)
+
+    metadata = pq.ParquetFile(str(tmp_path / "pgn_65265.parquet")).metadata
+    assert metadata.num_row_groups == 2
+    assert metadata.row_group(0).num_rows == 2
+    assert metadata.row_group(1).num_rows == 1
+
+
+def test_it_batch_decodes_fixed_length_payloads(spec, tmp_path, monkeypatch):
+    import decoda.export
+
+    batches = []
+    decode_batch = decoda.export.decode_batch
+
+    def recording_decode_batch(pgn, payloads):
+        batches.append((pgn.id, list(payloads)))
+        return decode_batch(pgn, payloads)
+
+    monkeypatch.setattr(decoda.export, "decode_batch", recording_decode_batch)
+    sut = Decoda(spec)
+    with ColumnarExporter(sut, str(tmp_path), row_group_size=10) as exporter:
+        for timestamp, can_id, payload in frames():
+            exporter.handle_frame(timestamp, can_id, payload)
+        exporter.handle_frame(4.0, 0x18FEF100, b"\x01")
+
+    assert batches == [
+        (
+            65265,
+            [
+                b"\x01\x00\x01\xff\xff\xff\xff\xff",
+                b"\x00\xff\xff\xff\xff\xff\xff\xff",
+                b"\x02\x40\x00\xff\xff\xff\xff\xff",
+            ],
+        )
+    ]
+
+
+@pytest.mark.parametrize(
+    "payload, status",
+    [
+        (b"\x05", BatchStatus.CLIPPED_TO_MIN),
+        (b"\x32", BatchStatus.VALID),
+        (b"\xc8", BatchStatus.CLIPPED_TO_MAX),
+        (b"\xfe", BatchStatus.ERROR_INDICATOR),
+        (b"\xff", BatchStatus.NOT_AVAILABLE),
+    ],
+)
+def test_it_gets_statuses_from_the_raw_values(payload, status):
+    from decoda.export import _status_from_decoded
+
+    spn = spn_from_dict(
+        {
+            "id": 1,
+            "name": "Level",
+            "bit_length": 8,
+            "data_range": {"min": 10, "max": 100},
+        }
+    )
+    decoded, _ = spn.decode(payload, "1", False, -1)
+
+    assert _status_from_decoded(decoded) == status
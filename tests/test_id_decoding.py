@@ -31,3 +31,12 @@ def test_it_unpacks_can_id(can_id, priority, pgn, sa, da):
 )
 def test_it_can_get_destination_address_from_pf_and_ps(pf, ps, da):
     assert Address.from_pf_and_ps(pf, ps) == da
+
+
+def test_it_reuses_address_instances():
+    _, _, sa, da = parts_from_can_id(0x18EA2531)
+    assert sa is Address.from_num(0x31)
+    assert da is Address.from_pf_and_ps(0xEA, 0x25)
+    assert Address.from_num(-1) is BroadcastAddress
+    with pytest.raises(ValueError):
+        Address.from_num(256)
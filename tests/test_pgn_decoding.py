@@ -2,6 +2,8 @@ import pytest
 
 from decoda import *
 
+from .conftest import SYNTHETIC_LAYOUT, SYNTHETIC_PAYLOADS
+
 BL8 = BitLength(8)
 
 
@@ -227,6 +229,48 @@ class TestStartPositionValueExtractions:
         )
 
 
+class TestCompiledLocations:
+    def test_it_compiles_a_single_section(self):
+        plan = compile_location("1.2", BitLength(15))
+        assert plan.section.byte_idx == 0
+        assert plan.section.bit_shift == 1
+        assert plan.section.mask == 0x7FFF
+        assert plan.section.byte_span == 2
+        assert plan.section.last_byte_idx == 1
+        assert plan.extra is None
+
+    def test_it_compiles_a_split_field_into_two_sections(self):
+        plan = compile_location("3-4, 5.6", BitLength(19))
+        assert plan.section.byte_idx == 2
+        assert plan.section.mask == 0xFFFF
+        assert plan.extra.byte_idx == 4
+        assert plan.extra.bit_shift == 5
+        assert plan.extra.value_shift == 16
+
+    def test_it_extracts_using_a_compiled_plan(self):
+        inp = (0x123456789ABCDEF0).to_bytes(8, "big")
+        plan = compile_location("3-4, 5.6", BitLength(19))
+        assert (0b1000111100001010110, 4) == extract_value_at_location(
+            inp, plan, BitLength(19)
+        )
+
+    @pytest.mark.parametrize(
+        ["location", "expected"],
+        [("1", 0), ("4 to N", 3), ("2-x", 1), ("a", None), ("2.1", None)],
+    )
+    def test_it_finds_the_first_byte_for_byte_oriented_values(
+        self, location, expected
+    ):
+        plan = compile_location(location, BitLength(None, True))
+        assert plan.first_byte_idx == expected
+
+    def test_it_defers_errors_until_extraction(self):
+        plan = compile_location("1,2,3", BitLength(8))
+        assert plan.section is None
+        with pytest.raises(UnsupportedLocationSpec):
+            plan.extract(b"\0\0\0")
+
+
 class TestStarDelimitedPGNs:
     @pytest.mark.parametrize(
         ["inp", "expected"],
@@ -431,3 +475,43 @@ class TestTransportProtocol:
             str(results[2])
             == "SPN:2571: Parameter Group Number of packeted message (TP.CM_Conn_Abort) = 16316149"
         )
+
+
+class TestGeneratedDecoders:
+    @pytest.mark.parametrize(
+        "payload",
+        SYNTHETIC_PAYLOADS,
+    )
+    def test_it_matches_the_generic_decoder(self, make_pgn, payload):
+        pgn = make_pgn(SYNTHETIC_LAYOUT + [(3, "4.3")])
+        assert pgn.decode(payload) == pgn.decode_generic(payload)
+        assert pgn._fast_decoder
+
+    def test_it_falls_back_for_short_payloads(self, make_pgn):
+        pgn = make_pgn([(1, "1-2"), (2, "3")])
+        with pytest.raises(ValueError):
+            pgn.decode(b"\x00")
+        assert pgn.decode(b"\x00\x00\x07")[1].value == 7
+
+    def test_it_is_not_generated_for_other_spn_types(self, make_pgn):
+        pgn = make_pgn([(1, "1-2"), (5, "3-4")])
+        assert pgn.decode(b"\x00\x00ab")[1].value == "ab"
+        assert pgn._fast_decoder is False
+
+    @pytest.mark.parametrize("projection", [{1}, {3, 4}, {2, 5}, {99}])
+    @pytest.mark.parametrize("spn_5_start", [None, "7-8"])
+    def test_it_only_decodes_the_projected_spns(
+        self, make_pgn, projection, spn_5_start
+    ):
+        layout = SYNTHETIC_LAYOUT + [(3, "4.3")]
+        if spn_5_start:
+            layout.append((5, spn_5_start))
+        pgn = make_pgn(layout)
+        payload = b"\x10\x27\x01\x65\xfd\x07ab"
+
+        expected = [d for d in pgn.decode(payload) if d.id in projection]
+        assert pgn.decode(payload, spns=projection) == expected
+        records, fast_decoder = pgn._projections[frozenset(projection)]
+        assert [r.spn.id for r in records] == [d.id for d in expected]
+        record_ids = [r.spn.id for r in records]
+        assert bool(fast_decoder) == bool(record_ids and 5 not in record_ids)
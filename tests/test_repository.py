@@ -1,3 +1,7 @@
+import json
+import os
+import struct
+
 import pytest
 
 from decoda import *
@@ -104,3 +108,228 @@ def test_it_raises_error_if_pgn_not_found():
     with pytest.raises(UnknownReferenceError) as e:
         repo.get_by_id(0)
     assert str(e.value) == "PGN not found for id: 0"
+
+
+def test_it_compiles_pgn_locations_on_load():
+    spns = Repo(
+        SPN,
+        spn_from_dict,
+        [{"id": 0, "name": "First", "bit_length": "4"}],
+    )
+    records = build_ordering_records([{"id": 0, "start_pos": "2.5"}], spns)
+
+    assert records[0].start == "2.5"
+    assert records[0].location == compile_location("2.5", BitLength(4))
+
+
+def test_it_loads_compiled_specs(spec, tmp_path):
+    compiled = tmp_path / "spec.bin"
+    pgn = spec.PGNs.get_by_id(0)
+    pgn.decode(bytes(8))  # Compiled specs can be saved after use
+    save_compiled_spec(spec, compiled)
+
+    loaded = load_compiled_spec(compiled)
+
+    assert loaded.PGNs.get_by_id(0).decode(bytes(range(8))) == pgn.decode(
+        bytes(range(8))
+    )
+    assert loaded.SPNs.get_by_id(2556) == spec.SPNs.get_by_id(2556)
+
+
+def pgn_dict(id, spn_ids):
+    return {
+        "id": id,
+        "name": "PGN {}".format(id),
+        "description": "",
+        "length": "8",
+        "spns": [
+            {"id": spn_id, "start_pos": str(idx + 1)}
+            for idx, spn_id in enumerate(spn_ids)
+        ],
+    }
+
+
+def write_spec(tmp_path, spns, pgns):
+    source = tmp_path / "spec.json"
+    source.write_text(
+        json.dumps(
+            {
+                "SPNs": spns,
+                "PGNs": pgns,
+                "Manufacturers": [],
+                "SourceAddresses": {},
+                "IndustryGroups": [],
+            }
+        )
+    )
+    return source
+
+
+def test_it_compiles_specs_from_the_command_line(tmp_path):
+    from decoda.cli import main
+
+    source = write_spec(
+        tmp_path,
+        [{"id": 1, "name": "One", "bit_length": "8"}],
+        [pgn_dict(2, [1])],
+    )
+    compiled = tmp_path / "spec.bin"
+
+    main(["compile-spec", str(source), str(compiled)])
+
+    loaded = load_compiled_spec(compiled)
+    assert loaded.PGNs.get_by_id(2).decode(b"\x05")[0].value == 5
+
+
+def test_it_rejects_specs_compiled_by_another_version(tmp_path):
+    compiled = tmp_path / "spec.bin"
+    compiled.write_bytes(
+        COMPILED_SPEC_MAGIC + struct.pack("<HH", 1, 3) + b"0.0"
+    )
+    with pytest.raises(ValueError):
+        load_compiled_spec(compiled)
+
+
+def test_it_only_loads_compiled_specs_when_asked_to(spec, tmp_path):
+    compiled = tmp_path / "spec.bin"
+    save_compiled_spec(spec, compiled)
+
+    with pytest.raises(ValueError) as e:
+        load_from_file(compiled)
+    assert "load_compiled_spec" in str(e.value)
+    with pytest.raises(ValueError):
+        load_compiled_spec(write_spec(tmp_path, [], []))
+
+
+def test_lazy_repo_only_builds_objects_when_used():
+    built = []
+
+    def from_dict(d):
+        built.append(d["id"])
+        return manufacturer_from_dict(d)
+
+    repo = LazyRepo(
+        Manufacturer,
+        from_dict,
+        [{"id": 0, "name": "First"}, {"id": 1, "name": "Second"}],
+    )
+    assert built == []
+
+    assert repo.get_by_id(1).name == "Second"
+    assert repo.get_by_id(1) is repo.get_by_id(1)
+    assert built == [1]
+
+
+def test_lazy_repo_treats_bad_dicts_as_not_found():
+    repo = LazyRepo(SPN, spn_from_dict, [{"id": 0, "name": "No length"}])
+    with pytest.raises(UnknownReferenceError) as e:
+        repo.get_by_id(0)
+    assert str(e.value) == "SPN not found for id: 0"
+    with pytest.raises(UnknownReferenceError):
+        repo.get_by_id(1)
+
+
+def test_it_can_load_specs_lazily(spec):
+    path = os.environ.get("J1939_SPEC_PATH", "./decoda_spec.json")
+    lazy = load_from_file(path, warn_of_errors=False, lazy=True)
+
+    payload = bytes(range(8))
+    expected = spec.PGNs.get_by_id(0).decode(payload)
+    actual = lazy.PGNs.get_by_id(0).decode(payload)
+    assert [(d.id, d.raw, d.value) for d in actual] == [
+        (d.id, d.raw, d.value) for d in expected
+    ]
+
+
+def test_it_builds_each_object_once_and_keeps_the_errors(
+    tmp_path, monkeypatch
+):
+    import decoda.spec_loader
+
+    built = []
+
+    def counting_spn_from_dict(d):
+        built.append(d["id"])
+        return spn_from_dict(d)
+
+    monkeypatch.setattr(
+        decoda.spec_loader, "spn_from_dict", counting_spn_from_dict
+    )
+    source = write_spec(
+        tmp_path,
+        [
+            {"id": 1, "name": "One", "bit_length": "8"},
+            {"id": 2, "name": "No length"},
+        ],
+        [pgn_dict(3, [1]), pgn_dict(4, [1, 2])],
+    )
+
+    loaded = load_from_file(source)
+
+    assert built == [1, 2]
+    assert [(d["id"], type(e)) for d, e in loaded.spns_in_error] == [
+        (2, KeyError)
+    ]
+    assert [(d["id"], type(e)) for d, e in loaded.pgns_in_error] == [
+        (4, UnknownReferenceError)
+    ]
+    assert loaded.PGNs.get_by_id(3).ordering_records[0].spn is (
+        loaded.SPNs.get_by_id(1)
+    )
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_it_finds_pgns_by_spn_acronym_and_name(tmp_path, lazy):
+    source = write_spec(
+        tmp_path,
+        [
+            {"id": 1, "name": "One", "bit_length": "8"},
+            {"id": 2, "name": "Two", "bit_length": "8"},
+        ],
+        [
+            dict(pgn_dict(3, [1]), acronym="EEC1"),
+            dict(pgn_dict(4, [2, 1]), acronym="EEC1"),
+            pgn_dict(5, [2, 9]),  # SPN 9 is not in the spec
+        ],
+    )
+
+    loaded = load_from_file(source, lazy=lazy)
+    pgns = loaded.PGNs
+
+    assert [(pgn.id, record.start) for pgn, record in pgns.find_by_spn(1)] == [
+        (3, "1"),
+        (4, "2"),
+    ]
+    assert [pgn.id for pgn, _ in pgns.find_by_spn(2)] == [4]
+    assert pgns.find_by_spn(9) == []
+    assert [pgn.id for pgn in pgns.find_by_acronym("eec1")] == [3, 4]
+    assert [pgn.id for pgn in pgns.find_by_name("PGN 4")] == [4]
+    assert pgns.find_by_name("PGN 5") == []
+
+
+def test_compiled_specs_keep_the_pgn_indices(spec, tmp_path):
+    compiled = tmp_path / "spec.bin"
+    save_compiled_spec(spec, compiled)
+
+    loaded = load_compiled_spec(compiled)
+
+    spn_id = spec.PGNs.get_by_id(0).ordering_records[0].spn.id
+    assert [pgn.id for pgn, _ in loaded.PGNs.find_by_spn(spn_id)] == [
+        pgn.id for pgn, _ in spec.PGNs.find_by_spn(spn_id)
+    ]
+    assert 0 in [pgn.id for pgn, _ in loaded.PGNs.find_by_spn(spn_id)]
+
+
+@pytest.mark.parametrize("repo_cls", [PGNRepo, LazyPGNRepo])
+def test_pgn_repos_can_be_built_from_a_generator(repo_cls):
+    spns = Repo(
+        SPN, spn_from_dict, [{"id": 1, "name": "One", "bit_length": 8}]
+    )
+
+    pgns = repo_cls(
+        PGN, pgn_from_dict, (pgn_dict(id, [1]) for id in (2, 3)), spns
+    )
+
+    assert [pgn.id for pgn, _ in pgns.find_by_spn(1)] == [2, 3]
+    assert [pgn.id for pgn in pgns.find_by_name("PGN 3")] == [3]
+    assert pgns.get_by_id(2).id == 2
@@ -1,3 +1,4 @@
+import pickle
 from unittest.mock import patch, sentinel
 
 import pytest
@@ -185,11 +186,78 @@ class TestScalarValue:
             == "Parameter specific indicator" + display_value_suffix
         )
 
+    @pytest.mark.parametrize(
+        ["bit_length", "raw", "expected"],
+        [
+            (8, 0xFA, None),
+            (8, 0xFB, ("Parameter specific indicator", None)),
+            (8, 0xFE, ("Error indicator", None)),
+            (8, 0xFF, ("Not available", None)),
+            (16, 0xFAFF, None),
+            (16, 0xFE05, ("Error indicator", 5)),
+            (32, 0xFF000005, ("Not available", 5)),
+            (12, 0xFFF, None),
+        ],
+    )
+    def test_it_reports_range_indicators_without_raising(
+        self, bit_length, raw, expected
+    ):
+        sut = scalar_value_from_dict({"bit_length": bit_length})
+        assert sut.range_indicator(raw) == expected
+
+    def test_it_still_raises_range_errors_when_checked(self):
+        sut = scalar_value_from_dict({"bit_length": 16})
+        with pytest.raises(NotAvaiableRangeError) as e:
+            sut.check_in_valid_range(0xFF05)
+        assert e.value.display_value() == "Not available (5)"
+        sut.check_in_valid_range(0x1234)
+
+    def test_it_compares_encodings_by_their_ranges(self):
+        wide = {"0x00000000-0x00FFFFFF": "Valid", "0xFF000000": "Error"}
+        assert EncodedValue(wide, BitLength(32)) == EncodedValue(
+            dict(wide), BitLength(32)
+        )
+        assert IntervalEncodings.from_ranges(
+            [(0, 10, "Range"), (5, 6, "Range")]
+        ) == IntervalEncodings((0,), (10,), ("Range",))
+        assert DenseEncodings(("Off", "On")) == IntervalEncodings(
+            (0, 1), (1, 2), ("Off", "On")
+        )
+        assert DenseEncodings(("Off", "On")) != DenseEncodings(("Off", None))
+
+    def test_it_requires_encodings_to_provide_lookups(self):
+        class NoRanges(Encodings):
+            def get(self, raw, default=None):
+                return default
+
+        with pytest.raises(TypeError):
+            NoRanges()
+
     def test_it_requires_positive_max_len(self):
         with pytest.raises(ValueError) as e:
             scalar_value_from_dict({"bit_length": -1})
         assert str(e.value) == "must have positive bit length"
 
+    @pytest.mark.parametrize(
+        ["byte_stream", "display_value"],
+        [
+            (b"\x7b", "123 XYZs"),
+            (b"\x00", "1 XYZs (encoded value 0 XYZs was clipped to min)"),
+            (b"\xff", "Not available"),
+        ],
+    )
+    def test_it_can_leave_the_display_value_to_be_formatted_later(
+        self, byte_stream, display_value
+    ):
+        sv = scalar_value_from_dict(
+            {"units": "XYZs", "data_range": {"min": 1}, "bit_length": 8}
+        )
+        result, _ = sv.decode_from_raw(
+            byte_stream, "1", False, -1, lazy_display=True
+        )
+        assert callable(result["display_value"])
+        assert result["display_value"]() == display_value
+
 
 class TestEncodedValue:
     def test_it_decodes_to_available_encodings(self):
@@ -208,6 +276,17 @@ class TestEncodedValue:
             "display_value": "No encoding (2)",
         }
 
+    def test_it_can_leave_the_display_value_to_be_formatted_later(self):
+        ev = EncodedValue({0: "Off", 1: "On"}, BitLength(2))
+        result, _ = ev.decode_from_raw(
+            b"\1", "1", False, -1, lazy_display=True
+        )
+        assert result["display_value"]() == "On (1)"
+        result, _ = ev.decode_from_raw(
+            b"\2", "1", False, -1, lazy_display=True
+        )
+        assert result["display_value"]() == "No encoding (2)"
+
     def test_it_raises_error_if_there_are_no_encodings(self):
         with pytest.raises(ValueError) as e:
             EncodedValue({}, None)
@@ -253,6 +332,37 @@ class TestEncodedValue:
             "display_value": "Agency defined (14)",
         }
 
+    def test_it_uses_a_dense_table_for_narrow_spns(self):
+        ev = EncodedValue({"0": "Off", "1": "On", "3": "N/A"}, BitLength(2))
+        assert isinstance(ev.encodings, DenseEncodings)
+        assert ev.encodings.table == ("Off", "On", None, "N/A")
+
+    def test_it_uses_intervals_for_wide_spns(self):
+        ev = EncodedValue(
+            {"0-64255": "Valid", "0xFE00-0xFEFF": "Error"}, BitLength(16)
+        )
+        assert isinstance(ev.encodings, IntervalEncodings)
+        assert ev.encodings.starts == (0, 0xFE00)
+        assert len(ev.encodings) == 64256 + 256
+
+        result, _ = ev.decode_from_raw(b"\x00\xfa", "1", False, -1)
+        assert result["value"] == "Valid"
+        result, _ = ev.decode_from_raw(b"\x00\xfb", "1", False, -1)
+        assert result["value"] is None
+        result, _ = ev.decode_from_raw(b"\x01\xfe", "1", False, -1)
+        assert result["value"] == "Error"
+
+    def test_later_encodings_take_precedence_when_they_overlap(self):
+        encodings = convert_encodings({"0-10": "Range", "5": "Five"})
+        assert encodings.get(4) == "Range"
+        assert encodings.get(5) == "Five"
+        assert encodings.get(6) == "Range"
+        assert encodings.get(11) is None
+        assert dict(encodings.items()) == {
+            **{k: "Range" for k in range(11)},
+            5: "Five",
+        }
+
     def test_it_requires_positive_max_len(self):
         encodings = {"0": "Don't care"}
         with pytest.raises(ValueError) as e:
@@ -406,6 +516,43 @@ class TestSPNDecoding:
         )
 
 
+class TestDecodedSPN:
+    def test_it_refers_to_the_spn(self):
+        spn = SPN(1, "Name", "Desc", None)
+        decoded = DecodedSPN(spn, 1, 2, "2")
+        assert decoded.spn is spn
+        assert (decoded.id, decoded.name, decoded.description) == (
+            1,
+            "Name",
+            "Desc",
+        )
+
+    def test_it_formats_the_display_value_lazily(self):
+        calls = []
+
+        def display():
+            calls.append(1)
+            return "2 units"
+
+        decoded = DecodedSPN(SPN(1, "Name", "Desc", None), 1, 2, display)
+        assert calls == []
+        assert decoded.display_value == "2 units"
+        assert decoded.display_value == "2 units"
+        assert calls == [1]
+        assert decoded == DecodedSPN.build(
+            SPN(1, "Name", "Desc", None), 1, 2, "2 units"
+        )
+
+    def test_it_does_not_have_a_dict(self):
+        decoded = DecodedSPN(SPN(1, "Name", "Desc", None), 1, 2, "2")
+        assert not hasattr(decoded, "__dict__")
+
+    def test_it_can_be_pickled(self):
+        spn = SPN(1, "Name", "Desc", None)
+        decoded = DecodedSPN(spn, 1, 2, lambda: "2")
+        assert pickle.loads(pickle.dumps(decoded)) == decoded
+
+
 class TestSPNConstruction:
     @patch("decoda.spec_loader.scalar_value_from_dict")
     def test_it_builds_a_scalar_decoding_spn(self, scalar_value_from_dict):
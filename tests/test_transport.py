@@ -1,3 +1,7 @@
+from typing import List
+
+import pytest
+
 from decoda import *
 
 
@@ -31,4 +35,336 @@ def test_embeddeduse_peer_to_peer_example(spec: J1939Spec):
     assert spn_val.display_value == payload
 
 
-# TODO - Test the defragmentation
+DM1_PAYLOAD = bytes(range(1, 15))
+
+
+def bam_frames(sa, pgn_id, payload):
+    packet_count = (len(payload) + 6) // 7
+    yield 0x1CECFF00 | sa, bytes(
+        [32, len(payload), 0, packet_count, 0xFF]
+    ) + pgn_id.to_bytes(3, "little")
+    padded = payload + b"\xff" * (packet_count * 7 - len(payload))
+    for seq in range(packet_count):
+        yield 0x1CEBFF00 | sa, bytes([seq + 1]) + padded[seq * 7 : seq * 7 + 7]
+
+
+def skip_if_in_spec(spec, pgn_id):
+    try:
+        spec.PGNs.get_by_id(pgn_id)
+    except UnknownReferenceError:
+        return
+    pytest.skip("PGN {} is in this spec".format(pgn_id))
+
+
+def make_connection_manager(spec, **kwargs):
+    messages, errors = [], []
+    decoda = Decoda(spec, messages.append, errors.append)
+    cm = ConnectionManager(decoda, lambda *args: errors.append(args), **kwargs)
+    return cm, messages, errors
+
+
+def test_it_reassembles_a_broadcast_announce_message(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(spec)
+    for can_id, payload in bam_frames(0x25, 65226, DM1_PAYLOAD):
+        cm.handle_frame(can_id, payload)
+
+    assert errors == []
+    assert [m.pgn.id for m in messages] == [60416, 60160, 60160, 65226]
+    reassembled = messages[-1]
+    assert reassembled.src_address == Address(0x25)
+    assert reassembled.dst_address == Address(0xFF)
+    assert reassembled.decoded == spec.PGNs.get_by_id(65226).decode(
+        DM1_PAYLOAD
+    )
+
+
+def test_it_can_skip_publishing_transport_frames(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(
+        spec, publish_transport_frames=False
+    )
+    for can_id, payload in bam_frames(0x25, 65226, DM1_PAYLOAD):
+        cm.handle_frame(can_id, payload)
+    cm.handle_frame(0x0C000000, bytes(8))
+
+    assert errors == []
+    assert [m.pgn.id for m in messages] == [65226, 0]
+
+
+def test_it_reassembles_after_request_and_clear_to_send(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(spec)
+    # 0x00 sends 10 bytes of PGN 65226 to 0x25, which asks for packet 1
+    cm.handle_frame(0x1CEC2500, bytes([16, 10, 0, 2, 2, 0xCA, 0xFE, 0]))
+    cm.handle_frame(0x1CEC0025, bytes([17, 2, 1, 0xFF, 0xFF, 0xCA, 0xFE, 0]))
+    cm.handle_frame(0x1CEB2500, bytes([1]) + DM1_PAYLOAD[:7])
+    cm.handle_frame(0x1CEB2500, bytes([2]) + DM1_PAYLOAD[7:10] + b"\xff" * 4)
+
+    assert errors == []
+    reassembled = messages[-1]
+    assert reassembled.pgn.id == 65226
+    assert reassembled.src_address == Address(0x00)
+    assert reassembled.dst_address == Address(0x25)
+    assert reassembled.payload == DM1_PAYLOAD[:10]
+
+
+@pytest.mark.parametrize("publish_transport_frames", [True, False])
+def test_it_reports_fragment_errors(spec: J1939Spec, publish_transport_frames):
+    cm, messages, errors = make_connection_manager(
+        spec, publish_transport_frames=publish_transport_frames
+    )
+    frames = list(bam_frames(0x25, 65226, DM1_PAYLOAD))
+    cm.handle_frame(*frames[1])
+    cm.handle_frame(*frames[0])
+    cm.handle_frame(*frames[2])
+
+    assert [reason for reason, _ in errors] == [
+        "fragment received without control",
+        "fragment received out of order",
+    ]
+    assert all(msg.pgn.id == 60160 for _, msg in errors)
+    assert 65226 not in [m.pgn.id for m in messages]
+
+
+def test_it_times_out_stalled_sessions(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(spec)
+    frames = list(bam_frames(0x25, 65226, DM1_PAYLOAD))
+    cm.handle_frame(*frames[0], timestamp=10.0)
+    cm.handle_frame(*frames[1], timestamp=10.5)
+    cm.handle_frame(*frames[2], timestamp=11.5)
+
+    assert [reason for reason, _ in errors] == [
+        "defragmentation timed out",
+        "fragment received without control",
+    ]
+    assert errors[0][1]["pgn"] == 65226
+    assert 65226 not in [m.pgn.id for m in messages]
+
+
+def test_it_expires_sessions_without_further_frames(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(spec)
+    frames = list(bam_frames(0x25, 65226, DM1_PAYLOAD))
+    cm.handle_frame(*frames[0], timestamp=10.0)
+    cm.handle_frame(*frames[1], timestamp=10.5)
+
+    cm.expire(11.0)
+    assert errors == []
+    cm.expire(11.3)
+    assert [reason for reason, _ in errors] == ["defragmentation timed out"]
+
+    cm.expire(20.0)
+    assert len(errors) == 1
+
+
+def test_it_refuses_sessions_with_invalid_sizes(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(
+        spec, publish_transport_frames=False
+    )
+    pgn = (65226).to_bytes(3, "little")
+    # More than 0xFFFFFF packets, and more bytes than the packets hold
+    cm.handle_frame(
+        0x1CC92500, bytes([20]) + (0xFFFFFFFF).to_bytes(4, "little") + pgn
+    )
+    cm.handle_frame(0x1CECFF25, bytes([32, 15, 0, 2, 0xFF]) + pgn)
+    cm.handle_frame(0x1CEBFF25, bytes([1]) + DM1_PAYLOAD[:7])
+
+    assert [(reason, info["size"]) for reason, info in errors[:2]] == [
+        ("invalid message size", 0xFFFFFFFF),
+        ("invalid message size", 15),
+    ]
+    assert [reason for reason, _ in errors[2:]] == [
+        "fragment received without control"
+    ]
+    assert cm._active_defrags == {}
+
+
+@pytest.mark.parametrize("spill_threshold", [1 << 20, 0])
+def test_it_reassembles_extended_transport_messages(
+    spec: J1939Spec, spill_threshold
+):
+    cm, messages, errors = make_connection_manager(
+        spec, spill_threshold=spill_threshold
+    )
+    size = len(DM1_PAYLOAD).to_bytes(4, "little")
+    pgn = (65226).to_bytes(3, "little")
+    # 0x00 sends PGN 65226 to 0x25, one packet per data packet offset
+    cm.handle_frame(0x1CC92500, bytes([20]) + size + pgn)
+    cm.handle_frame(0x1CC90025, bytes([21, 1, 1, 0, 0]) + pgn)
+    cm.handle_frame(0x1CC92500, bytes([22, 1, 0, 0, 0]) + pgn)
+    cm.handle_frame(0x1CC72500, bytes([1]) + DM1_PAYLOAD[:7])
+    cm.handle_frame(0x1CC90025, bytes([21, 1, 2, 0, 0]) + pgn)
+    cm.handle_frame(0x1CC92500, bytes([22, 1, 1, 0, 0]) + pgn)
+    cm.handle_frame(0x1CC72500, bytes([1]) + DM1_PAYLOAD[7:])
+
+    assert errors == []
+    assert [m.pgn.id for m in messages] == [65226]
+    assert bytes(messages[0].payload) == DM1_PAYLOAD
+    assert messages[0].decoded == spec.PGNs.get_by_id(65226).decode(
+        DM1_PAYLOAD
+    )
+
+
+def test_it_reports_unknown_pgns_to_the_error_handler(spec: J1939Spec):
+    messages: List[Message] = []
+    errors: List[Exception] = []
+    decoda = Decoda(spec, messages.append, errors.append)
+    unknown_can_id = 0x18EF2500  # PGN 61184 is not in every spec
+    skip_if_in_spec(spec, 61184)
+
+    decoda.handle_frame(unknown_can_id, bytes(8))
+    decoda.handle_frame(unknown_can_id, bytes(8))
+    decoda.handle_message(6, Address(0), BroadcastAddress, 61184, bytes(8))
+    decoda.handle_frame(0x0C000000, bytes(8))
+
+    assert len(errors) == 3
+    assert all(isinstance(e, UnknownReferenceError) for e in errors)
+    assert [m.pgn.id for m in messages] == [0]
+
+
+def test_it_decodes_batches_of_frames(spec: J1939Spec):
+    messages: List[Message] = []
+    errors: List[Exception] = []
+    decoda = Decoda(spec, messages.append, errors.append)
+    frames = [
+        (1.0, 0x0C000000, bytes(8)),
+        (1.5, 0x18EF2500, bytes(8)),
+        (2.0, 0x0C000025, bytes(range(8))),
+    ]
+    skip_if_in_spec(spec, 61184)
+
+    decoded = list(decoda.handle_frames(frames))
+
+    assert messages == []
+    assert len(errors) == 1
+    assert [(m.timestamp, m.pgn.id, m.src_address) for m in decoded] == [
+        (1.0, 0, Address(0)),
+        (2.0, 0, Address(0x25)),
+    ]
+    assert decoded[1].decoded == spec.PGNs.get_by_id(0).decode(bytes(range(8)))
+
+
+def test_it_can_decode_only_some_spns(spec: J1939Spec):
+    pgn_0_spns = [r.spn.id for r in spec.PGNs.get_by_id(0).ordering_records]
+    messages: List[Message] = []
+    errors: List[Exception] = []
+    defrag_errors: List[tuple] = []
+    decoda = Decoda(spec, messages.append, errors.append, spns={pgn_0_spns[1]})
+    cm = ConnectionManager(decoda, lambda *args: defrag_errors.append(args))
+
+    cm.handle_frame(0x0C000000, bytes(range(8)))
+    cm.handle_frame(0x18FECA00, bytes(8))  # PGN 65226 is dropped
+    for can_id, payload in bam_frames(0x25, 0, bytes(range(8))):
+        cm.handle_frame(can_id, payload)
+
+    assert errors == [] and defrag_errors == []
+    assert [m.pgn.id for m in messages] == [0, 60416, 60160, 60160, 0]
+    assert [d.id for d in messages[0].decoded] == [pgn_0_spns[1]]
+    assert messages[-1].decoded == messages[0].decoded
+
+
+def test_it_only_decodes_subscribed_frames(spec: J1939Spec, monkeypatch):
+    decoded_pgns = []
+    decode = PGN.decode
+
+    def counting_decode(pgn, payload, *args, **kwargs):
+        decoded_pgns.append(pgn.id)
+        return decode(pgn, payload, *args, **kwargs)
+
+    monkeypatch.setattr(PGN, "decode", counting_decode)
+    dm1_spn = spec.PGNs.get_by_id(65226).ordering_records[0].spn.id
+    by_pgn: List[Message] = []
+    by_spn: List[Message] = []
+    errors: List[Exception] = []
+    decoda = Decoda(spec, error_handler=errors.append)
+    decoda.subscribe(by_pgn.append, pgns=[0], source_addresses=range(32, 48))
+    subscription = decoda.subscribe(by_spn.append, spns=[dm1_spn])
+
+    decoda.handle_frame(0x0C000000, bytes(8))  # Not from a subscribed SA
+    decoda.handle_frame(0x0C000025, bytes(8))
+    decoda.handle_frame(0x18FECA00, bytes(8))
+    decoda.handle_frame(0x18ECFF00, bytes(8))  # Not subscribed
+    decoda.unsubscribe(subscription)
+    decoda.handle_frame(0x18FECA00, bytes(8))
+
+    assert errors == []
+    assert decoded_pgns == [0, 65226]
+    assert [(m.pgn.id, m.src_address) for m in by_pgn] == [(0, Address(0x25))]
+    assert [m.pgn.id for m in by_spn] == [65226]
+    assert [d.id for d in by_spn[0].decoded] == [dm1_spn]
+
+
+def test_subscriptions_do_not_filter_the_callback(spec: J1939Spec):
+    messages: List[Message] = []
+    subscribed: List[Message] = []
+    decoda = Decoda(spec, messages.append)
+    decoda.subscribe(subscribed.append, source_addresses=[Address(0x25)])
+
+    decoda.handle_frame(0x0C000000, bytes(8))
+    decoda.handle_frame(0x0C000025, bytes(8))
+
+    assert [m.src_address for m in messages] == [Address(0), Address(0x25)]
+    assert subscribed == messages[1:]
+
+
+def test_decoding_batches_of_frames_ignores_subscriptions(spec: J1939Spec):
+    subscribed: List[Message] = []
+    decoda = Decoda(spec)
+    decoda.subscribe(subscribed.append, source_addresses=[0x25])
+    frames = [(1.0, 0x0C000000, bytes(8)), (2.0, 0x0C000025, bytes(8))]
+
+    decoded = list(decoda.handle_frames(frames))
+
+    assert subscribed == []
+    assert [m.src_address for m in decoded] == [Address(0), Address(0x25)]
+
+
+def test_subscriptions_still_filter_with_a_connection_manager(
+    spec: J1939Spec, monkeypatch, capsys
+):
+    decoded_pgns: List[int] = []
+    decode = PGN.decode
+
+    def counting_decode(pgn, payload, *args, **kwargs):
+        decoded_pgns.append(pgn.id)
+        return decode(pgn, payload, *args, **kwargs)
+
+    monkeypatch.setattr(PGN, "decode", counting_decode)
+    subscribed: List[Message] = []
+    defrag_errors: List[tuple] = []
+    decoda = Decoda(spec)
+    decoda.subscribe(subscribed.append, pgns=[65226])
+    cm = ConnectionManager(decoda, lambda *args: defrag_errors.append(args))
+
+    cm.handle_frame(0x0C000000, bytes(8))
+    for can_id, payload in bam_frames(0x25, 65226, DM1_PAYLOAD):
+        cm.handle_frame(can_id, payload)
+
+    assert defrag_errors == []
+    assert 0 not in decoded_pgns
+    assert [m.pgn.id for m in subscribed] == [65226]
+    assert capsys.readouterr().out == ""
+
+
+def test_it_accepts_address_numbers(spec: J1939Spec):
+    cm, messages, errors = make_connection_manager(spec)
+    decoda = cm._decoda
+    bam = bytes([32, 14, 0, 2, 0xFF, 0xCA, 0xFE, 0])
+
+    decoda.handle_message(7, 0x25, 0xFF, 60416, bam)
+    decoda.handle_message(7, 0x25, 0xFF, 60160, bytes([1]) + DM1_PAYLOAD[:7])
+    decoda.handle_message(7, 0x25, 0xFF, 60160, bytes([2]) + DM1_PAYLOAD[7:])
+
+    assert errors == []
+    reassembled = messages[-1]
+    assert reassembled.pgn.id == 65226
+    assert reassembled.src_address == Address(0x25)
+    assert reassembled.dst_address == Address(0xFF)
+
+
+def test_subscriptions_match_address_numbers(spec: J1939Spec):
+    subscribed: List[Message] = []
+    decoda = Decoda(spec)
+    decoda.subscribe(subscribed.append, source_addresses=[1])
+
+    decoda.handle_message(3, 1, 0xFF, 0, bytes(8))
+    decoda.handle_message(3, 2, 0xFF, 0, bytes(8))
+
+    assert [m.src_address for m in subscribed] == [Address(1)]